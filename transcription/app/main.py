@@ -1,5 +1,6 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import uuid
 import base64
 import os
@@ -13,54 +14,33 @@ import time
 from fastapi import Body
 from pathlib import Path
 from io import BytesIO
-import tempfile
 import subprocess
 import concurrent.futures
-from faster_whisper import WhisperModel
-from app.services.streaming_transcription import get_or_create_session, end_session
+import itertools
+from app.services.streaming_transcription import get_or_create_session, finalize_session, get_scheduler, get_session, discard_session
+from app.services.inference_scheduler import PRIORITY_FINALIZE, PRIORITY_BATCH
+from app.services.chunk_store import create_chunk_store, get_chunk_store, discard_chunk_store, stored_bytes
+from app.services.audio_buffer import resident_bytes
+from app.services.audio_frames import is_audio_frame, parse_audio_frame, FrameError
+from app.services.timer_service import timer_service
+from app.services.session_registry import SessionRegistry
+from app.services.session_state import SessionState, aggregate_memory_usage
+from app.services.chunk_ingest import ACK_FLUSH_INTERVAL
+from app.services.send_queue import OutboundQueue, message_priority, PRIORITY_CONTROL, SEND_QUEUE_SIZE
+from app.services.protocol import MessageCodec, negotiate_codec, is_msgpack_map, to_frontend_format
 from app.services.whisper_model import get_whisper_model
 from app.services.note_generation import generate_medical_note
+from app.services.note_model import note_model
+from app.services.note_engine import note_engine
+from app.services.note_cache import note_cache
+from app.services.model_registry import loaded_models
+from app.services.audio_decoder import decode_to_pcm, pcm_to_wav_bytes, remux_webm, negotiate_audio_format, supported_audio_formats, decode_chunks
 
 os.environ["HF_HOME"] = "/hf_home"
 os.environ["XDG_CACHE_HOME"] = "/hf_home"
 
 ThreadPoolExecutor = concurrent.futures.ThreadPoolExecutor
 
-def to_frontend_format(data):
-    if not isinstance(data, dict):
-        return data
-
-    result = {}
-    for key, value in data.items():
-        parts = key.split('_')
-        camel_key = parts[0] + ''.join(x.title() for x in parts[1:])
-
-        if isinstance(value, dict):
-            result[camel_key] = to_frontend_format(value)
-        elif isinstance(value, list) and all(isinstance(item, dict) for item in value):
-            result[camel_key] = [to_frontend_format(item) for item in value]
-        else:
-            result[camel_key] = value
-
-    return result
-
-def from_frontend_format(data):
-    if not isinstance(data, dict):
-        return data
-
-    result = {}
-    for key, value in data.items():
-        snake_key = ''.join(['_' + c.lower() if c.isupper() else c for c in key]).lstrip('_')
-
-        if isinstance(value, dict):
-            result[snake_key] = from_frontend_format(value)
-        elif isinstance(value, list) and all(isinstance(item, dict) for item in value):
-            result[snake_key] = [from_frontend_format(item) for item in value]
-        else:
-            result[snake_key] = value
-
-    return result
-
 def give_transcript(audio_bytes):
     if not audio_bytes or len(audio_bytes) == 0:
         print("ERROR: No audio data provided to give_transcript")
@@ -69,32 +49,25 @@ def give_transcript(audio_bytes):
     print(f"Starting transcription of {len(audio_bytes)} bytes")
     start = time.time()
 
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_wav:
-        temp_wav_path = temp_wav.name
-        temp_wav.write(audio_bytes)
-
     try:
         model = get_whisper_model()
         transcription_start = time.time()
 
         try:
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(model.transcribe, temp_wav_path, beam_size=5)
-                try:
-                    segments, info = future.result(timeout=120)
-                except concurrent.futures.TimeoutError:
-                    return "Transcription timed out"
+            future = get_scheduler().submit(BytesIO(audio_bytes), priority=PRIORITY_BATCH, model=model, beam_size=5)
+            try:
+                segments = future.result(timeout=120).segments
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                return "Transcription timed out"
         except Exception as transcribe_error:
             print(f"ERROR during transcription: {transcribe_error}")
             traceback.print_exc()
             return f"Transcription error: {str(transcribe_error)}"
 
         transcript = ""
-        segment_count = 0
         try:
-            for segment in segments:
-                segment_count += 1
-                transcript += segment.text + " "
+            transcript = " ".join(segment.text.strip() for segment in segments)
         except Exception as segment_error:
             print(f"ERROR processing segments: {segment_error}")
             traceback.print_exc()
@@ -105,69 +78,23 @@ def give_transcript(audio_bytes):
         print(f"ERROR in give_transcript: {e}")
         traceback.print_exc()
         return f"Error during transcription: {str(e)}"
-    finally:
-        try:
-            if os.path.exists(temp_wav_path):
-                os.unlink(temp_wav_path)
-        except Exception as e:
-            print(f"Error cleaning up temporary file: {e}")
 
 def convert_webm_to_wav(webm_data):
     if not webm_data:
         return b""
 
-    with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as temp_webm:
-        temp_webm_path = temp_webm.name
-        temp_webm.write(webm_data)
-
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_wav:
-        temp_wav_path = temp_wav.name
-
     try:
-        ffmpeg_cmd = f"ffmpeg -i {temp_webm_path} -ar 16000 -ac 1 {temp_wav_path}"
-        try:
-            result = subprocess.run(
-                ffmpeg_cmd, shell=True, check=True, capture_output=True, timeout=30
-            )
-        except subprocess.TimeoutExpired:
-            return b""
-        except subprocess.CalledProcessError:
-            return b""
-
-        with open(temp_wav_path, 'rb') as wav_file:
-            wav_data = wav_file.read()
-            return wav_data
+        samples = decode_to_pcm(webm_data, input_format="webm")
+        return pcm_to_wav_bytes(samples)
+    except subprocess.TimeoutExpired:
+        return b""
+    except subprocess.CalledProcessError:
+        return b""
     except Exception as e:
         return b""
-    finally:
-        try:
-            os.unlink(temp_webm_path)
-            os.unlink(temp_wav_path)
-        except Exception:
-            pass
 
 def fix_webm_headers(webm_data):
-    with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as temp_input:
-        temp_input_path = temp_input.name
-        temp_input.write(webm_data)
-
-    with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as temp_output:
-        temp_output_path = temp_output.name
-
-    try:
-        subprocess.run(
-            f"ffmpeg -y -i {temp_input_path} -c copy -map 0 -movflags faststart {temp_output_path}",
-            shell=True, check=True, capture_output=True
-        )
-
-        with open(temp_output_path, 'rb') as fixed_file:
-            return fixed_file.read()
-    finally:
-        try:
-            os.unlink(temp_input_path)
-            os.unlink(temp_output_path)
-        except Exception:
-            pass
+    return remux_webm(webm_data)
 
 def get_transcription_service_url():
     service_url = "http://host.docker.internal:8000/transcribe"
@@ -205,8 +132,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-active_sessions = {}
-session_audio_buffers = {}
+active_sessions = SessionRegistry()
+
+# Cap on audio buffered by this node (encoded chunks plus decoded PCM); 0 disables it.
+# Only finished sessions are evicted, so active recordings can still exceed it
+SESSION_MEMORY_LIMIT_BYTES = int(os.environ.get("SESSION_MEMORY_LIMIT_MB", 0)) * 1024 * 1024
+
+# Small integer handles that binary audio frames use to address a session
+session_handles: Dict[int, str] = {}
+_next_session_handle = itertools.count(1)
+
+# Optional protocol features a client can request in start/resume_session
+SERVER_CAPABILITIES = {
+    "transcript_deltas": True,
+    "binary_audio": True,
+    "batched_acks": True,
+    "note_streaming": True,
+}
+
+INACTIVITY_TIMEOUT = 60
+APP_PING_INTERVAL = 15
+PROCESSING_HEARTBEAT_INTERVAL = 5
+# How long ingest waits for a congested client's send queue before carrying on
+SEND_BACKPRESSURE_TIMEOUT = 5
+# How long notes, acks and other control messages wait for a disconnected client to come back
+UNDELIVERED_RETENTION = 600
 
 class ConnectionManager:
     def __init__(self):
@@ -214,13 +164,29 @@ class ConnectionManager:
         self.last_activity: Dict[str, float] = {}
         self.last_pong: Dict[str, float] = {}
         self.connection_start_time: Dict[str, float] = {}
+        self.capabilities: Dict[str, dict] = {}
+        self.codecs: Dict[str, MessageCodec] = {}
+        self.outbound: Dict[str, OutboundQueue] = {}
+        self.undelivered: Dict[str, list] = {}
 
-    async def connect(self, websocket: WebSocket, client_id: str):
+    async def connect(self, websocket: WebSocket, client_id: str, codec: str = None):
         await websocket.accept()
         is_reconnection = client_id in self.last_activity
         self.active_connections[client_id] = websocket
+        self.codecs[client_id] = negotiate_codec(codec)
+
+        # Control messages the previous connection never delivered go out first on this one
+        undelivered = self.undelivered.pop(client_id, [])
+        timer_service.cancel(("undelivered", client_id))
+        if client_id in self.outbound:
+            undelivered += self.outbound[client_id].close()
+        outbound = self.outbound[client_id] = OutboundQueue(lambda message: self._write(client_id, websocket, message))
+        for message in undelivered:
+            outbound.put(message)
         self.last_activity[client_id] = time.time()
         self.last_pong[client_id] = time.time()
+        timer_service.schedule(("inactivity", client_id), INACTIVITY_TIMEOUT, lambda: self.check_inactivity(client_id))
+        timer_service.schedule(("app_ping", client_id), APP_PING_INTERVAL, lambda: self.send_app_ping(client_id))
 
         if not is_reconnection:
             self.connection_start_time[client_id] = time.time()
@@ -232,6 +198,13 @@ class ConnectionManager:
     def disconnect(self, client_id: str):
         if client_id in self.active_connections:
             del self.active_connections[client_id]
+            self.capabilities.pop(client_id, None)
+            self.codecs.pop(client_id, None)
+            outbound = self.outbound.pop(client_id, None)
+            if outbound is not None:
+                self.hold_undelivered(client_id, outbound.close())
+            timer_service.cancel(("inactivity", client_id))
+            timer_service.cancel(("app_ping", client_id))
             if client_id in self.last_activity:
                 del self.last_activity[client_id]
             if client_id in self.last_pong:
@@ -243,21 +216,80 @@ class ConnectionManager:
             else:
                 print(f"Client disconnected: {client_id}")
 
+    def update_capabilities(self, client_id: str, requested: dict):
+        if isinstance(requested, dict):
+            negotiated = self.capabilities.setdefault(client_id, {})
+            for name, value in requested.items():
+                if name in SERVER_CAPABILITIES:
+                    negotiated[name] = bool(value) and SERVER_CAPABILITIES[name]
+        return self.capabilities.get(client_id, {})
+
+    def codec(self, client_id: str) -> MessageCodec:
+        return self.codecs.get(client_id) or negotiate_codec(None)
+
+    def supports(self, client_id: str, capability: str) -> bool:
+        return bool(self.capabilities.get(client_id, {}).get(capability))
+
     async def send_json(self, client_id: str, data: dict):
-        if client_id in self.active_connections:
+        """Queue a message for the client's writer task; never waits on the socket.
+
+        Returns False if the message was dropped or is being held for the client's reconnection.
+        """
+        return self.queue_json(client_id, data)
+
+    def queue_json(self, client_id: str, data: dict):
+        """Synchronous send_json, for callbacks that cannot await"""
+        outbound = self.outbound.get(client_id)
+        if client_id in self.active_connections and outbound is not None:
+            return outbound.put(data)
+        if message_priority(data) == PRIORITY_CONTROL:
+            print(f"Client {client_id} not connected, holding {data.get('type')} until it reconnects")
+            self.hold_undelivered(client_id, [data])
+        else:
+            print(f"Cannot send message to client {client_id} - not in active connections")
+        return False
+
+    def hold_undelivered(self, client_id: str, messages: list):
+        """Keep control messages for delivery on the client's next connection"""
+        if not messages:
+            return
+        held = self.undelivered.setdefault(client_id, [])
+        held.extend(messages)
+        del held[:-SEND_QUEUE_SIZE]
+        timer_service.schedule(("undelivered", client_id), UNDELIVERED_RETENTION, lambda: self._expire_undelivered(client_id))
+
+    def _expire_undelivered(self, client_id: str):
+        held = self.undelivered.pop(client_id, None)
+        if held:
+            print(f"Dropping {len(held)} undelivered messages for {client_id}, it did not reconnect")
+        return None
+
+    async def wait_writable(self, client_id: str, timeout: float = SEND_BACKPRESSURE_TIMEOUT):
+        """Backpressure for the ingest side: wait while the client's send queue is congested"""
+        outbound = self.outbound.get(client_id)
+        if outbound is None or await outbound.wait_writable(timeout):
+            return True
+        print(f"Send queue for {client_id} still congested after {timeout}s ({outbound.depth} queued)")
+        return False
+
+    def send_queue_metrics(self):
+        return {client_id: outbound.metrics() for client_id, outbound in self.outbound.items()}
+
+    async def _write(self, client_id: str, websocket: WebSocket, data: dict):
+        if self.active_connections.get(client_id) is websocket:
             try:
-                frontend_data = to_frontend_format(data)
-                if "type" in data:
-                    frontend_data["type"] = data["type"].replace("_", "-")
+                payload = self.codec(client_id).encode(data)
 
-                websocket = self.active_connections[client_id]
                 if websocket.client_state != WebSocketState.CONNECTED:
                     print(f"Cannot send to {client_id} - connection not in CONNECTED state")
                     self.disconnect(client_id)
                     return
 
                 try:
-                    await websocket.send_json(frontend_data)
+                    if isinstance(payload, bytes):
+                        await websocket.send_bytes(payload)
+                    else:
+                        await websocket.send_text(payload)
                     self.last_activity[client_id] = time.time()
                 except WebSocketDisconnect as e:
                     print(f"WebSocket disconnected while sending to {client_id}: {e}")
@@ -291,41 +323,81 @@ class ConnectionManager:
 
     async def handle_binary_message(self, client_id: str, data: bytes):
         try:
-            await self.send_bytes(client_id, b"\x01")
+            if not is_audio_frame(data):
+                await self.send_bytes(client_id, b"\x01")
+                return
+
+            handle, sequence_number, flags, payload = parse_audio_frame(data)
+            session_id = session_handles.get(handle)
+
+            # Handles are small and sequential, so they only address the sender's own sessions;
+            # taking over a session goes through resume_session
+            session = active_sessions.get(session_id) if session_id else None
+            if session is None or session.client_id != client_id:
+                print(f"Dropping audio frame from {client_id} for session handle {handle} it does not own")
+                await self.send_json(client_id, {
+                    "type": "error",
+                    "message": "Invalid session handle",
+                    "sessionHandle": handle
+                })
+                return
+
+            await ingest_audio_chunk(client_id, session_id, payload, sequence_number=sequence_number)
+        except FrameError as e:
+            print(f"Invalid audio frame from {client_id}: {e}")
+            await self.send_json(client_id, {
+                "type": "error",
+                "message": "Invalid audio frame"
+            })
         except Exception as e:
             print(f"Error handling binary message from {client_id}: {e}")
 
-    async def check_inactive_connections(self, timeout_seconds: int = 60):
-        while True:
-            await asyncio.sleep(20)
-            current_time = time.time()
-            clients_to_disconnect = []
-
-            for client_id, last_active in list(self.last_activity.items()):
-                if current_time - last_active > timeout_seconds:
-                    connection_duration = 0
-                    if client_id in self.connection_start_time:
-                        connection_duration = current_time - self.connection_start_time[client_id]
-                    print(f"Client {client_id} inactive for {timeout_seconds}s (connected for {connection_duration:.2f}s), closing connection")
-                    clients_to_disconnect.append(client_id)
-
-            for client_id in clients_to_disconnect:
-                if client_id in self.active_connections:
-                    try:
-                        await self.active_connections[client_id].close(code=1000, reason="Inactivity timeout")
-                    except:
-                        pass
-                    self.disconnect(client_id)
+    async def check_inactivity(self, client_id: str, timeout_seconds: int = INACTIVITY_TIMEOUT):
+        """Timer callback: close the connection if idle, otherwise re-arm for the remaining time"""
+        last_active = self.last_activity.get(client_id)
+        if last_active is None or client_id not in self.active_connections:
+            return None
+
+        current_time = time.time()
+        idle = current_time - last_active
+        if idle < timeout_seconds:
+            return timeout_seconds - idle
+
+        connection_duration = 0
+        if client_id in self.connection_start_time:
+            connection_duration = current_time - self.connection_start_time[client_id]
+        print(f"Client {client_id} inactive for {timeout_seconds}s (connected for {connection_duration:.2f}s), closing connection")
+        try:
+            await self.active_connections[client_id].close(code=1000, reason="Inactivity timeout")
+        except:
+            pass
+        self.disconnect(client_id)
+        return None
+
+    async def send_app_ping(self, client_id: str):
+        """Timer callback: application-level ping every APP_PING_INTERVAL seconds"""
+        websocket = self.active_connections.get(client_id)
+        if websocket is None:
+            return None
+        try:
+            if websocket.client_state == WebSocketState.CONNECTED:
+                await self.send_json(client_id, {
+                    "type": "app-ping",
+                    "timestamp": time.time() * 1000
+                })
+        except Exception as e:
+            print(f"Error sending app ping to {client_id}: {e}")
+            return None
+        return APP_PING_INTERVAL
 
     async def handle_client_reconnection(self, client_id: str):
         client_sessions = []
-        for session_id, session in active_sessions.items():
-            if session.get("client_id") == client_id:
-                client_sessions.append({
-                    "id": session_id,
-                    "status": session.get("status", "unknown"),
-                    "startTime": session.get("start_time", 0)
-                })
+        for session_id, session in active_sessions.for_client(client_id):
+            client_sessions.append({
+                "id": session_id,
+                "status": session.status,
+                "startTime": session.start_time
+            })
 
         if not client_sessions:
             print(f"No active sessions found for client {client_id}")
@@ -364,6 +436,19 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """503 until the note model has loaded and warmed up"""
+    note_status = note_model.status()
+    body = {
+        "ready": note_status["ready"],
+        "noteModel": to_frontend_format(note_status),
+        "noteEngine": to_frontend_format(note_engine.stats()),
+        "noteCache": to_frontend_format(note_cache.stats()),
+        "whisperModels": loaded_models()
+    }
+    return JSONResponse(body, status_code=200 if note_status["ready"] else 503)
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     query_params = dict(websocket.query_params)
@@ -375,43 +460,17 @@ async def websocket_endpoint(websocket: WebSocket):
     else:
         print(f"Client connecting with ID: {client_id}")
 
-    inactive_checker_task = None
-    keepalive_task = None
-    ping_task = None
     is_reconnection = client_id in manager.active_connections
 
     try:
-        await manager.connect(websocket, client_id)
-        inactive_checker_task = asyncio.create_task(manager.check_inactive_connections())
-
-        async def send_app_ping():
-            try:
-                while True:
-                    await asyncio.sleep(15)
-                    if client_id in manager.active_connections:
-                        try:
-                            if websocket.client_state == WebSocketState.CONNECTED:
-                                await manager.send_json(client_id, {
-                                    "type": "app-ping",
-                                    "timestamp": time.time() * 1000
-                                })
-                        except Exception as e:
-                            print(f"Error sending app ping to {client_id}: {e}")
-                            break
-                    else:
-                        break
-            except asyncio.CancelledError:
-                pass
-            except Exception as e:
-                print(f"Error in app ping task for {client_id}: {e}")
-
-        app_ping_task = asyncio.create_task(send_app_ping())
+        await manager.connect(websocket, client_id, query_params.get('codec'))
 
         while True:
             try:
                 message = await asyncio.wait_for(websocket.receive(), timeout=60)
                 manager.last_activity[client_id] = time.time()
 
+                payload = None
                 if "bytes" in message:
                     bytes_data = message.get("bytes", b"")
                     if not bytes_data or bytes_data == b"\x00":
@@ -419,21 +478,24 @@ async def websocket_endpoint(websocket: WebSocket):
                             await websocket.send_bytes(b"\x00")
                         except Exception as e:
                             print(f"Error responding to ping from {client_id}: {e}")
-                    else:
+                        continue
+                    if not (manager.codec(client_id).binary and is_msgpack_map(bytes_data)):
                         await manager.handle_binary_message(client_id, bytes_data)
-                    continue
+                        continue
+                    payload = bytes_data
+                elif "text" in message:
+                    payload = message["text"]
 
-                if "text" in message:
+                if payload is not None:
                     try:
-                        if not message["text"].strip():
+                        if isinstance(payload, str) and not payload.strip():
                             try:
                                 await websocket.send_text("")
                             except Exception as e:
                                 print(f"Error responding to text ping from {client_id}: {e}")
                             continue
 
-                        data = json.loads(message["text"])
-                        data = from_frontend_format(data)
+                        data = manager.codec(client_id).decode(payload)
 
                         if "type" in data:
                             message_type = data["type"].replace("-", "_")
@@ -457,6 +519,8 @@ async def websocket_endpoint(websocket: WebSocket):
                             await handle_audio_chunk(client_id, data)
                         elif message_type == "resume_session":
                             await handle_resume_session(client_id, data)
+                        elif message_type == "transcript_ack":
+                            handle_transcript_ack(client_id, data)
                         elif message_type == "end_session":
                             await handle_end_session(client_id, data)
                         elif message_type == "delete_session":
@@ -523,49 +587,42 @@ async def websocket_endpoint(websocket: WebSocket):
         print(f"Error in WebSocket connection for {client_id}: {e}")
         traceback.print_exc()
     finally:
-        if app_ping_task and not app_ping_task.done():
-            app_ping_task.cancel()
-
-        if keepalive_task and not keepalive_task.done():
-            keepalive_task.cancel()
-
-        if inactive_checker_task and not inactive_checker_task.done():
-            inactive_checker_task.cancel()
-
         manager.disconnect(client_id)
 
-        for session_id, session in list(active_sessions.items()):
-            if session.get("client_id") == client_id:
-                if session.get("status") == "recording":
-                    session["status"] = "pending_completion"
-                    session["pendingFinalization"] = True
-                    session["lastEndAttempt"] = time.time()
-                    print(f"Session {session_id} marked as pending completion")
-
-                if session_id in session_audio_buffers:
-                    try:
-                        session_audio_buffers[session_id].close()
-                        del session_audio_buffers[session_id]
-                    except:
-                        pass
+        for session_id, session in active_sessions.for_client(client_id):
+            if session.status == "recording":
+                session.status = "pending_completion"
+                session.pending_finalization = True
+                session.last_end_attempt = time.time()
+                session.record_event("disconnected", client_id=client_id)
+                print(f"Session {session_id} marked as pending completion")
 
 
 async def handle_start_session(client_id: str, data: dict):
+    enforce_session_memory_limit()
     session_id = str(uuid.uuid4())
+    handle = next(_next_session_handle)
 
-    active_sessions[session_id] = {
-        "client_id": client_id,
-        "status": "recording",
-        "start_time": time.time(),
-        "transcript": "",
-        "metadata": data.get("metadata", {}),
-    }
+    requested_formats = (data.get("capabilities") or {}).get("audio_formats")
+    active_sessions[session_id] = SessionState(
+        session_id,
+        client_id,
+        handle=handle,
+        audio_format=negotiate_audio_format(requested_formats),
+        metadata=data.get("metadata", {}),
+    )
+    session_handles[handle] = session_id
 
-    session_audio_buffers[session_id] = BytesIO()
+    create_chunk_store(session_id)
+    capabilities = manager.update_capabilities(client_id, data.get("capabilities"))
 
     await manager.send_json(client_id, {
         "type": "session-created",
-        "sessionId": session_id
+        "sessionId": session_id,
+        "sessionHandle": handle,
+        "audioFormat": active_sessions[session_id].audio_format,
+        "audioFormats": list(supported_audio_formats()),
+        "capabilities": capabilities
     })
 
     print(f"Session created: {session_id} for client {client_id}")
@@ -584,13 +641,7 @@ async def handle_update_session_metadata(client_id: str, data: dict):
         return
 
     if metadata and isinstance(metadata, dict):
-        for key, value in metadata.items():
-            if key == "reasons" and isinstance(value, list):
-                active_sessions[session_id]["reasons"] = value
-            else:
-                if "metadata" not in active_sessions[session_id]:
-                    active_sessions[session_id]["metadata"] = {}
-                active_sessions[session_id]["metadata"][key] = value
+        active_sessions[session_id].metadata.update(metadata)
 
         await manager.send_json(client_id, {
             "type": "metadata_updated",
@@ -601,37 +652,30 @@ async def handle_update_session_metadata(client_id: str, data: dict):
         print(f"Updated metadata for session {session_id}")
 
 
-def transcribe_with_model(audio_bytes):
-    try:
-        from app.services.whisper_model import get_whisper_model
-
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_wav:
-            temp_wav_path = temp_wav.name
-            temp_wav.write(audio_bytes)
-
-        try:
-            model = get_whisper_model()
-            segments, info = model.transcribe(temp_wav_path, beam_size=5)
-
-            transcript = ""
-            for segment in segments:
-                transcript += segment.text + " "
-
-            return transcript.strip()
-        finally:
-            if os.path.exists(temp_wav_path):
-                os.unlink(temp_wav_path)
-    except Exception as e:
-        print(f"Error in direct transcription: {e}")
-        traceback.print_exc()
-        return ""
-
 async def handle_audio_chunk(client_id: str, data: dict):
     session_id = data.get("session_id")
     audio_base64 = data.get("audio")
     chunk_id = data.get("chunk_id")
-    sequence_number = data.get("sequence_number", 0)
+    sequence_number = data.get("sequence_number")
+
+    try:
+        if isinstance(audio_base64, (bytes, bytearray)):
+            audio_bytes = audio_base64
+        else:
+            audio_bytes = base64.b64decode(audio_base64)
+    except Exception as e:
+        print(f"Error decoding audio chunk: {e}")
+        await manager.send_json(client_id, {
+            "type": "error",
+            "message": "Failed to process audio chunk",
+            "sessionId": session_id,
+            "details": str(e)
+        })
+        return
+
+    await ingest_audio_chunk(client_id, session_id, audio_bytes, sequence_number=sequence_number, chunk_id=chunk_id)
 
+async def ingest_audio_chunk(client_id: str, session_id: str, audio_bytes, sequence_number=None, chunk_id=None):
     print(f"Processing audio chunk for session_id: {session_id}, sequence: {sequence_number}")
 
     if not session_id or session_id not in active_sessions:
@@ -642,28 +686,55 @@ async def handle_audio_chunk(client_id: str, data: dict):
         })
         return
 
-    session = active_sessions[session_id]
-    if session.get("client_id") != client_id:
-        print(f"Client {client_id} trying to submit audio for session {session_id} owned by {session.get('client_id')}")
-        session["client_id"] = client_id
-
-    try:
-        audio_bytes = base64.b64decode(audio_base64)
+    # Stop pulling audio off this socket while the client is not draining what we send it
+    await manager.wait_writable(client_id)
 
-        if session_id in session_audio_buffers:
-            session_audio_buffers[session_id].write(audio_bytes)
+    session = active_sessions[session_id]
+    if session.status in ("processing", "completed", "error"):
+        # Finalization owns the chunk store and streaming session from here on;
+        # recreating either would leak a session nobody finalizes
+        print(f"Ignoring late audio chunk {sequence_number} for session {session_id} ({session.status})")
+        await manager.send_json(client_id, {
+            "type": "error",
+            "message": "Session is no longer accepting audio",
+            "sessionId": session_id
+        })
+        return
 
-        transcription_session = get_or_create_session(session_id)
-        result = await transcription_session.process_chunk(audio_bytes, manager, client_id)
+    if session.client_id != client_id:
+        print(f"Client {client_id} trying to submit audio for session {session_id} owned by {session.client_id}")
+        session.client_id = client_id
 
-        active_sessions[session_id]["transcript"] = result["full_text"]
+    try:
+        chunk_store = get_chunk_store(session_id) or create_chunk_store(session_id)
+        ingest = session.ingest.accept(chunk_store, audio_bytes, sequence_number, chunk_id)
+        if ingest.duplicate:
+            print(f"Duplicate chunk {ingest.sequence_number} for session {session_id}, not re-ingesting")
+
+        transcription_session = get_or_create_session(session_id, chunk_store, session.audio_format)
+        for released in ingest.released:
+            result = transcription_session.add_chunk(released, manager, client_id)
+            session.transcript = result["full_text"]
+
+        if manager.supports(client_id, "batched_acks"):
+            if session.acks.add(chunk_id, ingest.duplicate):
+                await flush_chunk_acks(session_id)
+            elif ("chunk_acks", session_id) not in timer_service:
+                timer_service.schedule(("chunk_acks", session_id), ACK_FLUSH_INTERVAL, lambda: flush_chunk_acks(session_id))
+            return
 
-        await manager.send_json(client_id, {
+        ack = {
             "type": "chunk-ack",
             "sessionId": session_id,
             "chunkId": chunk_id,
-            "sequenceNumber": sequence_number
-        })
+            "sequenceNumber": ingest.sequence_number,
+            "expectedSequence": session.ingest.next_expected
+        }
+        if ingest.duplicate:
+            ack["duplicate"] = True
+        if ingest.missing:
+            ack["missing"] = ingest.missing
+        await manager.send_json(client_id, ack)
 
     except Exception as e:
         print(f"Error processing audio chunk: {e}")
@@ -675,6 +746,15 @@ async def handle_audio_chunk(client_id: str, data: dict):
             "details": str(e)
         })
 
+async def flush_chunk_acks(session_id: str):
+    """Send the session's pending acks as one chunk-acks message (also the flush timer callback)"""
+    timer_service.cancel(("chunk_acks", session_id))
+    session = active_sessions.get(session_id)
+    if session is None or not session.acks:
+        return None
+    await manager.send_json(session.client_id, session.acks.build(session_id, session.ingest))
+    return None
+
 async def handle_resume_session(client_id: str, data: dict):
     session_id = data.get("session_id")
 
@@ -683,35 +763,46 @@ async def handle_resume_session(client_id: str, data: dict):
         return
 
     session = active_sessions[session_id]
-    old_client_id = session.get("client_id")
+    old_client_id = session.client_id
 
     if old_client_id != client_id:
         print(f"Session {session_id} being resumed by client {client_id} (was {old_client_id})")
-        session["client_id"] = client_id
+        session.client_id = client_id
 
-    if session["status"] in ["disconnected", "pending_completion"]:
-        session["status"] = "recording"
-        session["reconnect_time"] = time.time()
+    if session.status in ["disconnected", "pending_completion"]:
+        session.status = "recording"
+        session.reconnect_time = time.time()
+        session.record_event("reconnected", client_id=client_id, client_time=data.get("client_time"))
 
-        session["reconnection_events"] = session.get("reconnection_events", [])
-        session["reconnection_events"].append({
-            "time": time.time(),
-            "client_id": client_id,
-            "client_time": data.get("client_time")
-        })
+    capabilities = manager.update_capabilities(client_id, data.get("capabilities"))
+    streaming_session = get_session(session_id)
 
-    transcription = session.get("transcript", "")
+    if streaming_session is not None and manager.supports(client_id, "transcript_deltas"):
+        transcript_sync = streaming_session.resume_from(data.get("transcript_version"))
+    else:
+        transcript_sync = {"transcript": session.transcript}
 
     await manager.send_json(client_id, {
         "type": "session-resumed",
         "sessionId": session_id,
-        "status": session["status"],
-        "transcript": transcription
+        "sessionHandle": session.handle,
+        "audioFormat": session.audio_format,
+        "status": session.status,
+        "capabilities": capabilities,
+        "expectedSequence": session.ingest.next_expected,
+        "missing": session.ingest.missing(),
+        **transcript_sync
     })
 
     print(f"Session {session_id} resumed for client {client_id}")
 
 
+def handle_transcript_ack(client_id: str, data: dict):
+    streaming_session = get_session(data.get("session_id"))
+    if streaming_session is not None and isinstance(data.get("version"), int):
+        streaming_session.acknowledge_version(data["version"])
+
+
 async def handle_end_session(client_id: str, data: dict):
     session_id = data.get("session_id") or data.get("sessionId")
 
@@ -726,11 +817,23 @@ async def handle_end_session(client_id: str, data: dict):
         return
 
     session = active_sessions[session_id]
-    current_transcript = session.get("transcript", "")
+    if session.status in ("processing", "completed"):
+        # A retried end-session must not start a second finalization
+        print(f"Session {session_id} already {session.status}, ignoring repeated end-session")
+        await manager.send_json(client_id, {
+            "type": "processing-status",
+            "sessionId": session_id,
+            "status": session.status,
+            "progress": 100 if session.status == "completed" else 50
+        })
+        return
+
+    await flush_chunk_acks(session_id)
+    current_transcript = session.transcript
     print(f"End session for {session_id} with transcript length: {len(current_transcript)}")
 
-    session["status"] = "processing"
-    session["pendingFinalization"] = False
+    session.status = "processing"
+    session.pending_finalization = False
 
     print(f"Sending processing-status message for session {session_id}")
 
@@ -744,64 +847,62 @@ async def handle_end_session(client_id: str, data: dict):
     except Exception as e:
         print(f"Error sending initial processing status: {e}")
 
-    heartbeat_task = None
+    heartbeat_key = ("processing_heartbeat", session_id)
 
-    async def send_periodic_heartbeats():
+    async def send_heartbeat():
+        if session_id not in active_sessions or active_sessions[session_id].status != "processing":
+            return None
         try:
-            while session_id in active_sessions and active_sessions[session_id]["status"] == "processing":
-                try:
-                    await manager.send_json(client_id, {
-                        "type": "processing-heartbeat",
-                        "sessionId": session_id,
-                        "timestamp": time.time() * 1000
-                    })
-                except Exception as e:
-                    print(f"Error sending heartbeat: {e}")
-                await asyncio.sleep(5)
-        except asyncio.CancelledError:
-            pass
+            await manager.send_json(client_id, {
+                "type": "processing-heartbeat",
+                "sessionId": session_id,
+                "timestamp": time.time() * 1000
+            })
         except Exception as e:
-            print(f"Error in heartbeat task: {e}")
+            print(f"Error sending heartbeat: {e}")
+        return PROCESSING_HEARTBEAT_INTERVAL
 
     try:
-        heartbeat_task = asyncio.create_task(send_periodic_heartbeats())
+        timer_service.schedule(heartbeat_key, 0, send_heartbeat)
         process_task = asyncio.create_task(process_session_audio(session_id, client_id))
 
         def on_task_done(task):
             try:
                 result = task.result()
                 print(f"Background task for session {session_id} completed")
-                if heartbeat_task and not heartbeat_task.done():
-                    heartbeat_task.cancel()
             except Exception as e:
                 print(f"Background task for session {session_id} failed: {e}")
                 traceback.print_exc()
-                if heartbeat_task and not heartbeat_task.done():
-                    heartbeat_task.cancel()
+            finally:
+                timer_service.cancel(heartbeat_key)
 
         process_task.add_done_callback(on_task_done)
         print(f"End session request for {session_id} handled, processing in background")
 
     except Exception as e:
         print(f"Error setting up processing tasks: {e}")
-        if heartbeat_task and not heartbeat_task.done():
-            heartbeat_task.cancel()
+        timer_service.cancel(heartbeat_key)
 
 
 async def handle_delete_session(client_id: str, data: dict):
     session_id = data.get("session_id")
 
     if session_id in active_sessions:
+        session_handles.pop(active_sessions[session_id].handle, None)
         del active_sessions[session_id]
         print(f"Deleted session {session_id}")
 
-    if session_id in session_audio_buffers:
-        try:
-            session_audio_buffers[session_id].close()
-            del session_audio_buffers[session_id]
-            print(f"Deleted audio buffer for session {session_id}")
-        except Exception as e:
-            print(f"Error cleaning up audio buffer: {e}")
+    try:
+        if discard_session(session_id):
+            print(f"Stopped streaming transcription for session {session_id}")
+    except Exception as e:
+        print(f"Error stopping streaming transcription: {e}")
+
+    try:
+        if discard_chunk_store(session_id):
+            print(f"Deleted audio chunks for session {session_id}")
+    except Exception as e:
+        print(f"Error cleaning up audio chunks: {e}")
 
     await manager.send_json(client_id, {
         "type": "session_deleted",
@@ -820,7 +921,7 @@ async def process_session_audio(session_id: str, client_id: str):
             return False
 
         session = active_sessions[session_id]
-        session["processing_start_time"] = processing_start_time
+        session.processing_start_time = processing_start_time
 
         await manager.send_json(client_id, {
             "type": "processing-status",
@@ -833,14 +934,26 @@ async def process_session_audio(session_id: str, client_id: str):
         print(f"Getting transcript for {session_id}")
         transcript = ""
 
-        session_transcript = session.get("transcript", "")
+        session_transcript = session.transcript
         print(f"Existing session transcript: {len(session_transcript) if session_transcript else 0} chars")
 
-        streaming_transcript = ""
+        # Chunks still held back behind a gap will not be resent now; stream them as they are
+        streaming_session = get_session(session_id)
+        if streaming_session is not None:
+            for released in session.ingest.flush():
+                streaming_session.add_chunk(released, manager, client_id)
+
+        streaming_transcript = None
+        FINALIZE_TIMEOUT = 60
         try:
-            from app.services.streaming_transcription import end_session
-            streaming_transcript = end_session(session_id)
+            streaming_transcript = await asyncio.wait_for(
+                finalize_session(session_id),
+                timeout=FINALIZE_TIMEOUT
+            )
             print(f"Got streaming transcript: {len(streaming_transcript) if streaming_transcript else 0} chars")
+        except asyncio.TimeoutError:
+            print(f"Tail finalization timed out after {FINALIZE_TIMEOUT}s, keeping partial transcript")
+            streaming_transcript = session_transcript
         except Exception as e:
             print(f"Error getting streaming transcript: {e}")
             traceback.print_exc()
@@ -855,21 +968,21 @@ async def process_session_audio(session_id: str, client_id: str):
         elif session_transcript and len(session_transcript.strip()) >= 50:
             print(f"Using existing session transcript ({len(session_transcript)} chars)")
             transcript = session_transcript
+        elif streaming_transcript and streaming_transcript.strip():
+            print("Streaming session already covered all audio, skipping full re-transcription")
+            transcript = streaming_transcript or session_transcript
         else:
             print("Using full audio transcription as fallback")
             try:
                 transcription_start = time.time()
                 TRANSCRIPTION_TIMEOUT = 60
 
-                if session_id in session_audio_buffers:
+                chunk_store = get_chunk_store(session_id)
+                if chunk_store is not None:
                     print(f"Transcribing full audio for {session_id}")
-                    audio_buffer = session_audio_buffers[session_id]
-                    audio_buffer.seek(0)
-                    audio_data = audio_buffer.read()
-                    audio_buffer.seek(0)
 
-                    if audio_data and len(audio_data) > 0:
-                        print(f"Audio buffer size: {len(audio_data)} bytes")
+                    if chunk_store.total_bytes > 0:
+                        print(f"Audio buffer size: {chunk_store.total_bytes} bytes in {len(chunk_store)} chunks")
 
                         partial_transcript = ""
                         if streaming_transcript and len(streaming_transcript) > 0:
@@ -880,12 +993,18 @@ async def process_session_audio(session_id: str, client_id: str):
                         if partial_transcript:
                             print(f"Will supplement fallback transcription with partial transcript ({len(partial_transcript)} chars)")
 
-                        from app.services.whisper_model import get_whisper_model
-                        model = get_whisper_model()
+                        audio_format = session.audio_format
+                        if audio_format == "webm":
+                            audio_input = chunk_store.reader()
+                        else:
+                            # Decoding the whole recording takes a while; keep it off the event loop
+                            audio_input = await asyncio.get_event_loop().run_in_executor(
+                                None, decode_chunks, [chunk for _, chunk in chunk_store.chunks()], audio_format
+                            )
 
                         try:
                             full_transcript = await asyncio.wait_for(
-                                asyncio.get_event_loop().run_in_executor(None, lambda: transcribe_with_model(audio_data)),
+                                transcribe_with_model(audio_input, client_id=client_id),
                                 timeout=TRANSCRIPTION_TIMEOUT
                             )
 
@@ -925,7 +1044,7 @@ async def process_session_audio(session_id: str, client_id: str):
         if not transcript or len(transcript.strip()) < 20:
             transcript = "Transcription not available or too short"
 
-        session["transcript"] = transcript
+        session.transcript = transcript
         print(f"Final transcript for {session_id} set: {len(transcript)} chars")
 
         await manager.send_json(client_id, {
@@ -939,9 +1058,8 @@ async def process_session_audio(session_id: str, client_id: str):
         print(f"Starting note generation with {len(transcript)} chars")
 
         reasons = []
-        if "metadata" in session and isinstance(session["metadata"], dict):
-            if "reasons" in session["metadata"] and isinstance(session["metadata"]["reasons"], list):
-                reasons = session["metadata"]["reasons"]
+        if isinstance(session.metadata.get("reasons"), list):
+            reasons = session.metadata["reasons"]
 
         note = ""
         try:
@@ -954,9 +1072,21 @@ async def process_session_audio(session_id: str, client_id: str):
                 "message": "Generating medical note"
             })
 
+            on_delta = None
+            if manager.supports(client_id, "note_streaming"):
+                delta_index = itertools.count()
+
+                def on_delta(text):
+                    manager.queue_json(client_id, {
+                        "type": "medical-note-delta",
+                        "sessionId": session_id,
+                        "index": next(delta_index),
+                        "delta": text
+                    })
+
             note_start_time = time.time()
             note = await asyncio.wait_for(
-                generate_medical_note(transcript, reasons),
+                generate_medical_note(transcript, reasons, on_delta),
                 timeout=NOTE_TIMEOUT
             )
             note_generation_time = time.time() - note_start_time
@@ -978,57 +1108,46 @@ async def process_session_audio(session_id: str, client_id: str):
             note = create_fallback_note(transcript, reasons)
 
         try:
-            if session_id in session_audio_buffers:
-                print(f"Cleaning up audio buffer for {session_id}")
-                session_audio_buffers[session_id].close()
-                del session_audio_buffers[session_id]
+            if discard_chunk_store(session_id):
+                print(f"Cleaned up audio chunks for {session_id}")
         except Exception as e:
-            print(f"Error cleaning up audio buffer: {e}")
+            print(f"Error cleaning up audio chunks: {e}")
 
         print(f"Sending note to client: {len(note)} chars")
 
-        async def send_with_retry(message_type, data, max_retries=3):
-            for attempt in range(max_retries):
-                try:
-                    full_message = {
-                        "type": message_type,
-                        "sessionId": session_id,
-                        **data
-                    }
-                    await manager.send_json(client_id, full_message)
-                    return True
-                except Exception as e:
-                    print(f"Error sending {message_type} (attempt {attempt+1}): {e}")
-                    await asyncio.sleep(1)
-            return False
-
-        note_sent = await send_with_retry("medical-note", {
+        note_sent = await manager.send_json(client_id, {
+            "type": "medical-note",
+            "sessionId": session_id,
             "note": note
         })
 
         if not note_sent:
-            print(f"Failed to send medical note to client")
+            print(f"Medical note for {session_id} not queued on a live connection")
 
-        status_sent = await send_with_retry("processing-status", {
+        status_sent = await manager.send_json(client_id, {
+            "type": "processing-status",
+            "sessionId": session_id,
             "status": "completed",
             "progress": 100
         })
 
         if not status_sent:
-            print(f"Failed to send completion status to client")
+            print(f"Completion status for {session_id} not queued on a live connection")
 
         if session_id in active_sessions:
-            session["status"] = "completed"
-            session["medicalNote"] = note
-            session["end_time"] = time.time()
-            session["processing_end_time"] = time.time()
+            session.status = "completed"
+            session.medical_note = note
+            session.end_time = time.time()
+            session.processing_end_time = time.time()
 
-        ended_sent = await send_with_retry("session-ended", {
+        ended_sent = await manager.send_json(client_id, {
+            "type": "session-ended",
+            "sessionId": session_id,
             "status": "complete"
         })
 
         if not ended_sent:
-            print(f"Failed to send session-ended to client")
+            print(f"session-ended for {session_id} not queued on a live connection")
 
         print(f"PROCESS_SESSION_AUDIO COMPLETED in {time.time() - processing_start_time:.2f}s for {session_id}")
         return note_sent and status_sent and ended_sent
@@ -1039,10 +1158,11 @@ async def process_session_audio(session_id: str, client_id: str):
         processing_duration = time.time() - processing_start_time
 
         try:
-            if session_id in active_sessions and active_sessions[session_id].get("status") == "processing":
-                active_sessions[session_id]["status"] = "error"
-                active_sessions[session_id]["error"] = f"Processing timeout after {processing_duration:.2f}s"
-                active_sessions[session_id]["processing_end_time"] = time.time()
+            if session_id in active_sessions and active_sessions[session_id].status == "processing":
+                session = active_sessions[session_id]
+                session.status = "error"
+                session.error = f"Processing timeout after {processing_duration:.2f}s"
+                session.processing_end_time = time.time()
 
                 await manager.send_json(client_id, {
                     "type": "processing-status",
@@ -1068,20 +1188,16 @@ async def process_session_audio(session_id: str, client_id: str):
         processing_duration = time.time() - processing_start_time
 
         try:
-            if session_id in active_sessions and active_sessions[session_id].get("status") == "processing":
-                active_sessions[session_id]["status"] = "error"
-                active_sessions[session_id]["error"] = str(e)
-                active_sessions[session_id]["processing_end_time"] = time.time()
+            if session_id in active_sessions and active_sessions[session_id].status == "processing":
+                session = active_sessions[session_id]
+                session.status = "error"
+                session.error = str(e)
+                session.processing_end_time = time.time()
 
                 try:
-                    transcript = active_sessions[session_id].get("transcript", "")
-                    reasons = []
-                    if "metadata" in active_sessions[session_id] and isinstance(active_sessions[session_id]["metadata"], dict):
-                        if "reasons" in active_sessions[session_id]["metadata"]:
-                            reasons = active_sessions[session_id]["metadata"]["reasons"]
-
-                    fallback_note = create_fallback_note(transcript, reasons)
-                    active_sessions[session_id]["medicalNote"] = fallback_note
+                    reasons = session.metadata.get("reasons", [])
+                    fallback_note = create_fallback_note(session.transcript, reasons)
+                    session.medical_note = fallback_note
 
                     await manager.send_json(client_id, {
                         "type": "medical-note",
@@ -1123,26 +1239,20 @@ def create_fallback_note(transcript, reasons):
 Une synthèse n'a pas pu être générée en raison d'une erreur technique.
 """
 
-def transcribe_with_model(audio_data):
+async def transcribe_with_model(audio_stream, client_id=None):
     try:
         from app.services.whisper_model import get_whisper_model
 
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_wav:
-            temp_wav_path = temp_wav.name
-            temp_wav.write(audio_data)
-
-        try:
-            model = get_whisper_model()
-            segments, info = model.transcribe(temp_wav_path, beam_size=5)
-
-            transcript = ""
-            for segment in segments:
-                transcript += segment.text + " "
+        model = get_whisper_model()
+        result = await get_scheduler().transcribe(
+            audio_stream,
+            priority=PRIORITY_FINALIZE,
+            client_id=client_id,
+            model=model,
+            beam_size=5,
+        )
 
-            return transcript.strip()
-        finally:
-            if os.path.exists(temp_wav_path):
-                os.unlink(temp_wav_path)
+        return " ".join(segment.text.strip() for segment in result.segments).strip()
     except Exception as e:
         print(f"Error in transcribe_with_model: {e}")
         traceback.print_exc()
@@ -1214,44 +1324,95 @@ async def get_session_status(session_id: str):
     session = active_sessions[session_id]
 
     return {
-        "status": session.get("status", "unknown"),
-        "progress": 100 if session.get("status") == "completed" else 50,
-        "transcript": session.get("transcript", ""),
-        "note": session.get("medicalNote", ""),
-        "startTime": session.get("start_time", 0),
-        "endTime": session.get("end_time", 0)
+        "status": session.status,
+        "progress": 100 if session.status == "completed" else 50,
+        "transcript": session.transcript,
+        "note": session.medical_note,
+        "startTime": session.start_time,
+        "endTime": session.end_time
+    }
+
+
+@app.get("/api/sessions/memory")
+async def get_sessions_memory():
+    """Memory held by in-memory sessions on this node, overall and per status"""
+    usage = aggregate_memory_usage(active_sessions.items())
+    by_status = usage.pop("by_status")
+    return {
+        **to_frontend_format(usage),
+        "byStatus": {status: to_frontend_format(totals) for status, totals in by_status.items()},
+        "bufferedAudioBytes": buffered_audio_bytes(),
+        "limitBytes": SESSION_MEMORY_LIMIT_BYTES
+    }
+
+
+@app.get("/api/connections/send-queues")
+async def get_send_queue_metrics():
+    """Outbound queue depth and drop/coalesce counters per connected client"""
+    queues = manager.send_queue_metrics()
+    return {
+        "connections": len(queues),
+        "totalDepth": sum(metrics["depth"] for metrics in queues.values()),
+        "underPressure": sum(1 for metrics in queues.values() if metrics["under_pressure"]),
+        "clients": {client_id: to_frontend_format(metrics) for client_id, metrics in queues.items()}
     }
 
 
+def buffered_audio_bytes():
+    """Encoded and decoded audio held by all sessions, from running totals"""
+    return stored_bytes() + resident_bytes()
+
+
+def enforce_session_memory_limit():
+    """Drop the oldest finished sessions still holding audio while buffered audio exceeds SESSION_MEMORY_LIMIT_BYTES"""
+    if not SESSION_MEMORY_LIMIT_BYTES or buffered_audio_bytes() <= SESSION_MEMORY_LIMIT_BYTES:
+        return
+    finished = sorted(
+        active_sessions.with_status("completed") + active_sessions.with_status("error"),
+        key=lambda item: item[1].start_time
+    )
+    for session_id, session in finished:
+        if buffered_audio_bytes() <= SESSION_MEMORY_LIMIT_BYTES:
+            return
+        if get_chunk_store(session_id) is None and get_session(session_id) is None:
+            continue
+        discard_session(session_id)
+        discard_chunk_store(session_id)
+        session_handles.pop(session.handle, None)
+        del active_sessions[session_id]
+        print(f"Evicted session {session_id} to stay under the session memory limit")
+
+    if buffered_audio_bytes() > SESSION_MEMORY_LIMIT_BYTES:
+        print(f"Warning: active sessions hold {buffered_audio_bytes()} bytes of audio, "
+              f"over the {SESSION_MEMORY_LIMIT_BYTES} byte session memory limit")
+
+
 async def cleanup_old_sessions():
     while True:
         current_time = time.time()
-        for session_id, session in list(active_sessions.items()):
-
-            if current_time - session.get("start_time", current_time) > 86400:
-                if session_id in session_audio_buffers:
-                    try:
-                        session_audio_buffers[session_id].close()
-                        del session_audio_buffers[session_id]
-                    except:
-                        pass
-                del active_sessions[session_id]
-                print(f"Cleaned up old session: {session_id}")
+        for session_id, session in active_sessions.pop_older_than(current_time - 86400):
+            try:
+                discard_session(session_id)
+                discard_chunk_store(session_id)
+            except:
+                pass
+            session_handles.pop(session.handle, None)
+            print(f"Cleaned up old session: {session_id}")
         await asyncio.sleep(3600)
 
 async def monitor_processing_sessions():
     while True:
         current_time = time.time()
-        for session_id, session in list(active_sessions.items()):
-            if session.get("status") == "processing":
-
-                if session.get("start_processing_time") and current_time - session.get("start_processing_time") > 300:
-                    print(f"Session {session_id} processing timeout - marking as error")
-                    session["status"] = "error"
-                    session["error"] = "Processing timeout"
+        for session_id, session in active_sessions.with_status("processing"):
+            if session.processing_start_time and current_time - session.processing_start_time > 300:
+                print(f"Session {session_id} processing timeout - marking as error")
+                session.status = "error"
+                session.error = "Processing timeout"
         await asyncio.sleep(30)
 
 @app.on_event("startup")
 async def startup_event():
+    timer_service.start()
+    asyncio.create_task(note_model.start())
     asyncio.create_task(monitor_processing_sessions())
     asyncio.create_task(cleanup_old_sessions())
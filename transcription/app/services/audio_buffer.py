@@ -0,0 +1,134 @@
+"""
+Bounded per-session PCM storage.
+
+Keeps the most recent `horizon_seconds` of decoded audio in a float32 array
+that grows on demand up to twice the horizon, and spills older samples to an
+anonymous temp file as PCM16. Sample positions are absolute from the start of
+the session.
+"""
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+
+SAMPLE_RATE = 16000
+INITIAL_BUFFER_SECONDS = 10
+
+# Bytes of float32 windows held across all buffers, kept current on reallocation
+_resident_bytes = 0
+_resident_lock = threading.Lock()
+
+
+def _account(delta):
+    global _resident_bytes
+    with _resident_lock:
+        _resident_bytes += delta
+
+
+def resident_bytes():
+    """Bytes of decoded PCM currently held in memory by every buffer"""
+    return _resident_bytes
+
+
+class PCMBuffer:
+    """Bounded float32 window over a session's audio with disk spill"""
+
+    def __init__(self, horizon_seconds=None, sample_rate=SAMPLE_RATE):
+        if horizon_seconds is None:
+            horizon_seconds = float(os.environ.get("PCM_BUFFER_SECONDS", "120"))
+        self.sample_rate = sample_rate
+        self.horizon = int(horizon_seconds * sample_rate)
+        self.capacity = self.horizon * 2
+        self._data = np.zeros(0, dtype=np.float32)
+        self._length = 0
+        self.start = 0
+        self._spill = None
+        self._lock = threading.Lock()
+
+    @property
+    def total_samples(self):
+        return self.start + self._length
+
+    @property
+    def memory_bytes(self):
+        return self._data.nbytes
+
+    @property
+    def spilled_samples(self):
+        return self.start
+
+    def append(self, samples):
+        """Append float32 samples, spilling the oldest audio beyond the horizon"""
+        if len(samples) == 0:
+            return
+        with self._lock:
+            offset = 0
+            while offset < len(samples):
+                part = samples[offset:offset + self.horizon]
+                needed = self._length + len(part)
+                if needed > self.capacity:
+                    self._spill_oldest(needed - self.horizon)
+                elif needed > len(self._data):
+                    self._grow(needed)
+                self._data[self._length:self._length + len(part)] = part
+                self._length += len(part)
+                offset += len(part)
+
+    def _grow(self, needed):
+        """Reallocate geometrically, capped at capacity; old views keep the old array"""
+        size = max(needed, 2 * len(self._data), INITIAL_BUFFER_SECONDS * self.sample_rate)
+        data = np.zeros(min(size, self.capacity), dtype=np.float32)
+        data[:self._length] = self._data[:self._length]
+        self._replace(data)
+
+    def _spill_oldest(self, count):
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(prefix="pcm-spill-")
+        oldest = self._data[:count]
+        self._spill.seek(0, os.SEEK_END)
+        self._spill.write((np.clip(oldest, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+
+        # Move the retained horizon into a fresh array so views already handed
+        # out keep pointing at the old samples; amortised O(1) per sample
+        data = np.zeros(self.capacity, dtype=np.float32)
+        data[:self._length - count] = self._data[count:self._length]
+        self._replace(data)
+        self._length -= count
+        self.start += count
+
+    def _replace(self, data):
+        _account(data.nbytes - self._data.nbytes)
+        self._data = data
+
+    def view(self, start_sample, end_sample=None):
+        """Samples in [start_sample, end_sample); a view when the range is still in memory"""
+        with self._lock:
+            total = self.start + self._length
+            end_sample = total if end_sample is None else min(end_sample, total)
+            start_sample = max(0, min(start_sample, end_sample))
+
+            if start_sample >= self.start:
+                return self._data[start_sample - self.start:end_sample - self.start]
+
+            spilled = self._read_spill(start_sample, min(end_sample, self.start))
+            if end_sample <= self.start:
+                return spilled
+            in_memory = self._data[:end_sample - self.start]
+            return np.concatenate((spilled, in_memory))
+
+    def _read_spill(self, start_sample, end_sample):
+        if self._spill is None or end_sample <= start_sample:
+            return np.zeros(0, dtype=np.float32)
+        self._spill.seek(start_sample * 2)
+        pcm = self._spill.read((end_sample - start_sample) * 2)
+        return np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+
+    def close(self):
+        with self._lock:
+            self._replace(np.zeros(0, dtype=np.float32))
+            self._length = 0
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
@@ -0,0 +1,297 @@
+"""In-memory decoding of PCM16, Opus packets and WebM audio to 16 kHz float32"""
+import functools
+import io
+import os
+import shutil
+import struct
+import subprocess
+import threading
+import wave
+
+import numpy as np
+
+try:
+    import av
+except ImportError:
+    av = None
+
+
+SAMPLE_RATE = 16000
+
+# Cheapest first: raw PCM needs no decoding, Opus packets decode independently,
+# WebM needs a container demuxer in front of the codec
+AUDIO_FORMATS = ("pcm16", "opus", "webm")
+OPUS_SAMPLE_RATE = 48000
+OPUS_PACKET_HEADER = struct.Struct("!H")
+
+
+def _ffmpeg_decode_cmd(input_format=None, sample_rate=SAMPLE_RATE):
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-fflags", "nobuffer"]
+    if input_format:
+        cmd += ["-f", input_format]
+    cmd += ["-i", "pipe:0", "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"]
+    return cmd
+
+
+def _process_rss(pid):
+    """Resident set size of a child process in bytes (0 where /proc is unavailable)"""
+    try:
+        with open(f"/proc/{pid}/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def pcm16_to_float32(pcm_bytes):
+    """Convert little-endian PCM16 bytes to float32 samples in [-1, 1]"""
+    return np.frombuffer(pcm_bytes, dtype="<i2").astype(np.float32) / 32768.0
+
+
+class StreamingAudioDecoder:
+    """Long-lived ffmpeg process fed with WebM/Opus chunks, yielding 16 kHz mono float32 PCM"""
+
+    def __init__(self, input_format="webm", sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.decoded_samples = 0
+        self._pending = bytearray()
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self.process = subprocess.Popen(
+            _ffmpeg_decode_cmd(input_format, sample_rate),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._reader = threading.Thread(target=self._read_stdout, daemon=True)
+        self._reader.start()
+
+    def _read_stdout(self):
+        try:
+            while True:
+                data = self.process.stdout.read1(65536)
+                if not data:
+                    break
+                with self._lock:
+                    self._pending.extend(data)
+        except Exception as e:
+            print(f"Error reading decoder output: {e}")
+
+    def feed(self, chunk):
+        """Push an encoded chunk and return the samples decoded since the last call"""
+        if self._closed:
+            return self.read()
+        try:
+            self.process.stdin.write(chunk)
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError) as e:
+            print(f"Decoder pipe closed: {e}")
+            self._closed = True
+        return self.read()
+
+    @property
+    def memory_bytes(self):
+        """Undelivered PCM plus the resident size of the ffmpeg process"""
+        rss = _process_rss(self.process.pid) if self.process.poll() is None else 0
+        return len(self._pending) + rss
+
+    def read(self):
+        """Return newly decoded samples without blocking"""
+        with self._lock:
+            usable = len(self._pending) - (len(self._pending) % 2)
+            if usable == 0:
+                return np.zeros(0, dtype=np.float32)
+            pcm = bytes(self._pending[:usable])
+            del self._pending[:usable]
+        samples = pcm16_to_float32(pcm)
+        self.decoded_samples += len(samples)
+        return samples
+
+    def flush(self, timeout=10):
+        """Signal end of stream, wait for ffmpeg to drain and return the remaining samples"""
+        if not self._closed:
+            self._closed = True
+            try:
+                self.process.stdin.close()
+            except Exception:
+                pass
+        self._reader.join(timeout)
+        return self.read()
+
+    def close(self):
+        """Terminate the ffmpeg process"""
+        self._closed = True
+        try:
+            self.process.stdin.close()
+        except Exception:
+            pass
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+
+class PCM16Decoder:
+    """Raw little-endian PCM16 mono at the session sample rate; no decoding needed"""
+
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.decoded_samples = 0
+        self._carry = b""
+
+    def feed(self, chunk):
+        view = memoryview(chunk)
+        if self._carry:
+            data = self._carry + bytes(view)
+            self._carry = b""
+        else:
+            data = view
+        usable = len(data) - (len(data) % 2)
+        self._carry = bytes(data[usable:])
+        samples = pcm16_to_float32(data[:usable])
+        self.decoded_samples += len(samples)
+        return samples
+
+    @property
+    def memory_bytes(self):
+        return len(self._carry)
+
+    def read(self):
+        return np.zeros(0, dtype=np.float32)
+
+    def flush(self, timeout=None):
+        return self.read()
+
+    def close(self):
+        self._carry = b""
+
+
+class OpusPacketDecoder:
+    """Raw Opus packets (fixed frame size, each prefixed by a u16 length) decoded in-process"""
+
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.decoded_samples = 0
+        self._carry = b""
+        self.codec = av.CodecContext.create("opus", "r")
+        self.codec.sample_rate = OPUS_SAMPLE_RATE
+        self.codec.layout = "mono"
+        self.resampler = av.AudioResampler(format="s16", layout="mono", rate=sample_rate)
+
+    def feed(self, chunk):
+        data = self._carry + bytes(chunk) if self._carry else memoryview(chunk)
+        parts = []
+        offset = 0
+        while offset + OPUS_PACKET_HEADER.size <= len(data):
+            (length,) = OPUS_PACKET_HEADER.unpack_from(data, offset)
+            end = offset + OPUS_PACKET_HEADER.size + length
+            if end > len(data):
+                break
+            packet = av.Packet(bytes(data[offset + OPUS_PACKET_HEADER.size:end]))
+            for frame in self.codec.decode(packet):
+                for resampled in self.resampler.resample(frame):
+                    parts.append(resampled.to_ndarray().reshape(-1))
+            offset = end
+        self._carry = bytes(data[offset:])
+
+        if not parts:
+            return np.zeros(0, dtype=np.float32)
+        samples = np.concatenate(parts).astype(np.float32) / 32768.0
+        self.decoded_samples += len(samples)
+        return samples
+
+    @property
+    def memory_bytes(self):
+        return len(self._carry)
+
+    def read(self):
+        return np.zeros(0, dtype=np.float32)
+
+    def flush(self, timeout=None):
+        return self.read()
+
+    def close(self):
+        self._carry = b""
+
+
+@functools.lru_cache(maxsize=1)
+def supported_audio_formats():
+    """Formats this server can ingest, cheapest first"""
+    formats = ["pcm16"]
+    if av is not None:
+        try:
+            av.CodecContext.create("opus", "r")
+            formats.append("opus")
+        except Exception:
+            pass
+    if shutil.which("ffmpeg"):
+        formats.append("webm")
+    return tuple(formats)
+
+
+def negotiate_audio_format(requested):
+    """Pick the cheapest format both sides support; WebM when the client does not say"""
+    if not requested:
+        return "webm"
+    supported = supported_audio_formats()
+    for audio_format in AUDIO_FORMATS:
+        if audio_format in requested and audio_format in supported:
+            return audio_format
+    return "webm"
+
+
+def create_decoder(audio_format="webm", sample_rate=SAMPLE_RATE):
+    if audio_format == "pcm16":
+        return PCM16Decoder(sample_rate=sample_rate)
+    if audio_format == "opus":
+        return OpusPacketDecoder(sample_rate=sample_rate)
+    return StreamingAudioDecoder(input_format="webm", sample_rate=sample_rate)
+
+
+def decode_chunks(chunks, audio_format, sample_rate=SAMPLE_RATE):
+    """Decode a full sequence of raw (non-container) chunks to float32 samples"""
+    decoder = create_decoder(audio_format, sample_rate)
+    try:
+        parts = [decoder.feed(chunk) for chunk in chunks]
+        parts.append(decoder.flush())
+    finally:
+        decoder.close()
+    parts = [part for part in parts if len(part)]
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+
+
+def decode_to_pcm(data, input_format=None, sample_rate=SAMPLE_RATE, timeout=30):
+    """Decode a complete encoded blob to float32 samples in one ffmpeg call"""
+    if not data:
+        return np.zeros(0, dtype=np.float32)
+    result = subprocess.run(
+        _ffmpeg_decode_cmd(input_format, sample_rate),
+        input=bytes(data),
+        capture_output=True,
+        timeout=timeout,
+        check=True,
+    )
+    return pcm16_to_float32(result.stdout)
+
+
+def pcm_to_wav_bytes(samples, sample_rate=SAMPLE_RATE):
+    """Wrap float32 samples in an in-memory 16-bit mono WAV container"""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def remux_webm(data, timeout=30):
+    """Rewrite a WebM stream through ffmpeg so it gets clean container headers"""
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0", "-c", "copy", "-map", "0", "-f", "webm", "pipe:1"],
+        input=bytes(data),
+        capture_output=True,
+        timeout=timeout,
+        check=True,
+    )
+    return result.stdout
@@ -0,0 +1,50 @@
+"""
+Binary WebSocket framing for audio chunks.
+
+Frame layout (network byte order):
+
+    magic    u8   0xAF
+    flags    u8   FLAG_* bits
+    handle   u32  session handle returned in session-created
+    sequence u32  chunk sequence number, from 0 (ignored with FLAG_NO_SEQUENCE)
+    payload  ...  raw codec bytes
+
+Parsing works on a memoryview so the payload is never copied.
+"""
+import struct
+
+
+FRAME_MAGIC = 0xAF
+HEADER = struct.Struct("!BBII")
+HEADER_SIZE = HEADER.size
+
+FLAG_NO_SEQUENCE = 0x01
+
+
+class FrameError(ValueError):
+    pass
+
+
+def is_audio_frame(data):
+    return len(data) >= 1 and data[0] == FRAME_MAGIC
+
+
+def parse_audio_frame(data):
+    """Return (handle, sequence_number, flags, payload memoryview)"""
+    view = memoryview(data)
+    if len(view) < HEADER_SIZE:
+        raise FrameError(f"Audio frame too short ({len(view)} bytes)")
+
+    magic, flags, handle, sequence_number = HEADER.unpack_from(view)
+    if magic != FRAME_MAGIC:
+        raise FrameError(f"Unexpected frame magic 0x{magic:02x}")
+    if flags & FLAG_NO_SEQUENCE:
+        sequence_number = None
+    return handle, sequence_number, flags, view[HEADER_SIZE:]
+
+
+def build_audio_frame(handle, sequence_number, payload, flags=0):
+    if sequence_number is None:
+        flags |= FLAG_NO_SEQUENCE
+        sequence_number = 0
+    return HEADER.pack(FRAME_MAGIC, flags, handle, sequence_number) + bytes(payload)
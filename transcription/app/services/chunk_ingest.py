@@ -0,0 +1,163 @@
+"""
+Idempotent, ordered chunk ingestion for a session.
+
+Clients may resend chunks after an ack timeout or replay them from
+IndexedDB after a reconnect, and chunks can arrive out of order. The
+sequencer stores every new chunk in the session's ChunkStore, drops
+duplicates by sequence number or chunk id, and releases chunks to the
+transcriber strictly in sequence order, starting from FIRST_SEQUENCE. Gaps
+are held open for a bounded reorder window and reported back so the client
+only resends what is actually missing.
+
+Connections that negotiate `batched_acks` get one cumulative + selective
+ack per batch of chunks instead of a chunk-ack per chunk.
+"""
+import os
+from collections import OrderedDict, namedtuple
+
+from app.services.chunk_store import FIRST_SEQUENCE
+
+
+REORDER_WINDOW = int(os.environ.get("CHUNK_REORDER_WINDOW", 32))
+DEDUP_HISTORY = 4096
+
+IngestResult = namedtuple("IngestResult", ["sequence_number", "duplicate", "released", "missing"])
+
+
+def _remember(entries, key, value):
+    entries[key] = value
+    if len(entries) > DEDUP_HISTORY:
+        entries.popitem(last=False)
+
+
+class ChunkSequencer:
+    """Reorder window, duplicate filter and gap tracker in front of a ChunkStore"""
+
+    def __init__(self, window=REORDER_WINDOW, first_sequence=FIRST_SEQUENCE):
+        self.window = window
+        # Fixed by the protocol, not by whichever chunk happens to arrive first:
+        # the first chunk carries the container header and must not be skipped
+        self.next_expected = first_sequence
+        self.pending = set()
+        self.duplicates = 0
+        self.lost = 0
+        self.late = 0
+        self._chunk_ids = OrderedDict()
+
+    def accept(self, store, data, sequence_number=None, chunk_id=None):
+        """Store a chunk unless it is a duplicate; returns an IngestResult"""
+        if chunk_id is not None and chunk_id in self._chunk_ids:
+            return self._duplicate(self._chunk_ids[chunk_id])
+        if sequence_number is not None and sequence_number in store:
+            return self._duplicate(sequence_number)
+
+        sequence_number = store.add(sequence_number, data)
+        if chunk_id is not None:
+            _remember(self._chunk_ids, chunk_id, sequence_number)
+
+        if sequence_number < self.next_expected:
+            # Its slot was already given up; keep the audio but do not stream it out of order
+            self.late += 1
+            return IngestResult(sequence_number, False, [], self.missing())
+
+        self.pending.add(sequence_number)
+        return IngestResult(sequence_number, False, self._release(), self.missing())
+
+    def flush(self):
+        """Release everything still held back, skipping over any gaps"""
+        return self._release(force=True)
+
+    def missing(self):
+        """Sequence numbers inside the reorder window that have not arrived yet"""
+        if not self.pending:
+            return []
+        return [sequence for sequence in range(self.next_expected, max(self.pending)) if sequence not in self.pending]
+
+    def stats(self):
+        return {
+            "next_expected": self.next_expected,
+            "pending": len(self.pending),
+            "duplicates": self.duplicates,
+            "lost": self.lost,
+            "late": self.late,
+        }
+
+    def _duplicate(self, sequence_number):
+        self.duplicates += 1
+        return IngestResult(sequence_number, True, [], self.missing())
+
+    def _release(self, force=False):
+        released = []
+        while self.pending:
+            if self.next_expected in self.pending:
+                self.pending.remove(self.next_expected)
+                released.append(self.next_expected)
+                self.next_expected += 1
+                continue
+            if force or len(self.pending) > self.window or max(self.pending) - self.next_expected > self.window:
+                # Give up on the oldest gap so the stream keeps moving
+                first = min(self.pending)
+                self.lost += first - self.next_expected
+                self.next_expected = first
+                continue
+            break
+        return released
+
+
+ACK_BATCH_SIZE = int(os.environ.get("CHUNK_ACK_BATCH_SIZE", 16))
+ACK_FLUSH_INTERVAL = float(os.environ.get("CHUNK_ACK_FLUSH_MS", 100)) / 1000
+
+
+def sequence_ranges(sequences):
+    """Collapse sequence numbers into sorted inclusive [start, end] ranges"""
+    ranges = []
+    for sequence in sorted(sequences):
+        if ranges and sequence == ranges[-1][1] + 1:
+            ranges[-1][1] = sequence
+        else:
+            ranges.append([sequence, sequence])
+    return ranges
+
+
+class AckBatcher:
+    """Collects a session's chunk acks and emits them as one cumulative + selective ack"""
+
+    def __init__(self, batch_size=ACK_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.chunk_ids = []
+        self.count = 0
+        self.duplicates = 0
+
+    def add(self, chunk_id=None, duplicate=False):
+        """Record one ack; returns True once the batch is full and should be flushed"""
+        self.count += 1
+        if chunk_id is not None:
+            self.chunk_ids.append(chunk_id)
+        if duplicate:
+            self.duplicates += 1
+        return self.count >= self.batch_size
+
+    def build(self, session_id, sequencer):
+        """Message for everything recorded since the last flush; resets the batch.
+
+        cumulativeSequence: the server needs nothing at or below it again
+        (received, or a gap it has given up on). selectiveAcks: ranges received
+        above it, still held in the reorder window.
+        """
+        message = {
+            "type": "chunk-acks",
+            "sessionId": session_id,
+            "cumulativeSequence": sequencer.next_expected - 1,
+            "selectiveAcks": sequence_ranges(sequencer.pending),
+            "missing": sequencer.missing(),
+            "chunkIds": self.chunk_ids,
+            "count": self.count,
+            "duplicates": self.duplicates,
+        }
+        self.chunk_ids = []
+        self.count = 0
+        self.duplicates = 0
+        return message
+
+    def __bool__(self):
+        return self.count > 0
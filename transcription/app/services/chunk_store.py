@@ -0,0 +1,157 @@
+"""
+Single per-session store of encoded audio chunks.
+
+The ingest path, the streaming transcriber and the end-of-session fallback
+all read the same chunk objects through memoryviews; nothing is copied
+into a second buffer.
+"""
+import bisect
+import io
+import threading
+
+
+# Sequence numbers start here, whether assigned by the client or by the store
+FIRST_SEQUENCE = 0
+
+# Encoded bytes held across all stores, kept current on add/close
+_stored_bytes = 0
+_stored_lock = threading.Lock()
+
+
+def _account(delta):
+    global _stored_bytes
+    with _stored_lock:
+        _stored_bytes += delta
+
+
+def stored_bytes():
+    """Encoded audio bytes currently held by every chunk store"""
+    return _stored_bytes
+
+
+class ChunkStore:
+    """Encoded chunks of one session keyed by sequence number"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self._chunks = {}
+        self._sequences = []
+        self._offsets = None
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def next_sequence(self):
+        return self._sequences[-1] + 1 if self._sequences else FIRST_SEQUENCE
+
+    def add(self, sequence_number, data):
+        """Store a chunk without copying it; returns its sequence number"""
+        view = memoryview(data)
+        with self._lock:
+            if sequence_number is None:
+                sequence_number = self.next_sequence
+            if sequence_number in self._chunks:
+                return sequence_number
+
+            index = bisect.bisect_left(self._sequences, sequence_number)
+            self._sequences.insert(index, sequence_number)
+            self._chunks[sequence_number] = view
+            self.total_bytes += view.nbytes
+            self._offsets = None
+        _account(view.nbytes)
+        return sequence_number
+
+    def __contains__(self, sequence_number):
+        return sequence_number in self._chunks
+
+    def __len__(self):
+        return len(self._sequences)
+
+    def get(self, sequence_number):
+        return self._chunks.get(sequence_number)
+
+    def chunks(self, start_sequence=None):
+        """Chunks in sequence order as (sequence_number, memoryview) pairs"""
+        with self._lock:
+            sequences = self._sequences
+            if start_sequence is not None:
+                sequences = sequences[bisect.bisect_left(sequences, start_sequence):]
+            return [(sequence, self._chunks[sequence]) for sequence in sequences]
+
+    def reader(self):
+        """Seekable file-like view over the concatenated chunks"""
+        return io.BufferedReader(ChunkReader(self))
+
+    def _layout(self):
+        with self._lock:
+            if self._offsets is None:
+                offsets = []
+                position = 0
+                for sequence in self._sequences:
+                    offsets.append(position)
+                    position += self._chunks[sequence].nbytes
+                self._offsets = offsets
+            return self._offsets, [self._chunks[sequence] for sequence in self._sequences]
+
+    def close(self):
+        with self._lock:
+            _account(-self.total_bytes)
+            self._chunks.clear()
+            self._sequences = []
+            self._offsets = None
+            self.total_bytes = 0
+
+
+class ChunkReader(io.RawIOBase):
+    """Raw stream reading across a ChunkStore's memoryviews without joining them"""
+
+    def __init__(self, store):
+        self._offsets, self._views = store._layout()
+        self.size = self._offsets[-1] + self._views[-1].nbytes if self._views else 0
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(0, min(offset, self.size))
+        return self._position
+
+    def readinto(self, buffer):
+        if self._position >= self.size:
+            return 0
+        index = bisect.bisect_right(self._offsets, self._position) - 1
+        view = self._views[index]
+        start = self._position - self._offsets[index]
+        count = min(len(buffer), view.nbytes - start)
+        buffer[:count] = view[start:start + count]
+        self._position += count
+        return count
+
+
+session_chunk_stores = {}
+
+def create_chunk_store(session_id):
+    """Create (or reset) the chunk store for a session"""
+    store = ChunkStore(session_id)
+    session_chunk_stores[session_id] = store
+    return store
+
+def get_chunk_store(session_id):
+    return session_chunk_stores.get(session_id)
+
+def discard_chunk_store(session_id):
+    store = session_chunk_stores.pop(session_id, None)
+    if store is not None:
+        store.close()
+    return store is not None
@@ -0,0 +1,238 @@
+"""Priority-aware, fair, batching job queue shared by every Whisper transcription path"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import Future
+
+import numpy as np
+
+try:
+    from faster_whisper import BatchedInferencePipeline
+except ImportError:
+    BatchedInferencePipeline = None
+
+
+SAMPLE_RATE = 16000
+BATCH_WINDOW_SECONDS = 30
+
+PRIORITY_FINALIZE = 0
+PRIORITY_STREAMING = 1
+PRIORITY_BATCH = 2
+PRIORITY_CLASSES = (PRIORITY_FINALIZE, PRIORITY_STREAMING, PRIORITY_BATCH)
+
+# Rough size of one second of compressed (Opus/WebM) audio, for jobs given as encoded bytes
+ENCODED_BYTES_PER_SECOND = 4000
+
+TranscribedSegment = namedtuple("TranscribedSegment", ["start", "end", "text"])
+TranscriptionResult = namedtuple("TranscriptionResult", ["segments", "language", "language_probability"])
+
+
+class InferenceJob:
+    def __init__(self, audio, model, priority, client_id, weight, options):
+        self.audio = audio
+        self.model = model
+        self.priority = priority
+        self.client_id = client_id
+        self.weight = weight
+        self.options = options
+        self.future = Future()
+        self.submitted_at = time.time()
+        self.finish_tag = 0.0
+
+    @property
+    def cost(self):
+        """Estimated audio seconds, used as the fair-queuing cost"""
+        if isinstance(self.audio, np.ndarray):
+            return len(self.audio) / SAMPLE_RATE
+        if hasattr(self.audio, "getbuffer"):
+            return len(self.audio.getbuffer()) / ENCODED_BYTES_PER_SECOND
+        size = getattr(getattr(self.audio, "raw", self.audio), "size", None)
+        return size / ENCODED_BYTES_PER_SECOND if size else 1.0
+
+    @property
+    def batch_key(self):
+        """Jobs can share a batch only if they decode with the same model and settings.
+
+        The batched pipeline detects the language once for the whole batch, so
+        jobs that rely on auto-detection are never batched.
+        """
+        if not isinstance(self.audio, np.ndarray) or len(self.audio) > BATCH_WINDOW_SECONDS * SAMPLE_RATE:
+            return None
+        if self.options.get("language") is None:
+            return None
+        return (
+            id(self.model),
+            self.options.get("language"),
+            self.options.get("task", "transcribe"),
+            self.options.get("beam_size", 5),
+            self.options.get("initial_prompt"),
+            self.options.get("condition_on_previous_text", True),
+        )
+
+
+class InferenceScheduler:
+    """Priority-aware, fair, batching job queue in front of the Whisper model"""
+
+    def __init__(self, model, max_batch_size=8, max_wait_ms=50, concurrency=1):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.concurrency = concurrency
+        self._pipelines = {}
+
+        self._queues = {priority: [] for priority in PRIORITY_CLASSES}
+        self._virtual_time = {priority: 0.0 for priority in PRIORITY_CLASSES}
+        self._client_finish = {priority: {} for priority in PRIORITY_CLASSES}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+        self._workers = [
+            threading.Thread(target=self._run, name=f"whisper-scheduler-{index}", daemon=True)
+            for index in range(concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, audio, priority=PRIORITY_STREAMING, client_id=None, weight=1.0, model=None, **options):
+        """Queue a float32 16 kHz window (or an encoded file-like); returns a concurrent.futures.Future"""
+        job = InferenceJob(audio, model or self.model, priority, client_id, weight, options)
+        with self._condition:
+            finishes = self._client_finish[priority]
+            start_tag = max(self._virtual_time[priority], finishes.get(client_id, 0.0))
+            job.finish_tag = start_tag + job.cost / max(weight, 1e-3)
+            finishes[client_id] = job.finish_tag
+            heapq.heappush(self._queues[priority], (job.finish_tag, next(self._sequence), job))
+            self._condition.notify()
+        return job.future
+
+    async def transcribe(self, audio, **options):
+        """Awaitable wrapper around submit()"""
+        return await asyncio.wrap_future(self.submit(audio, **options))
+
+    def queue_depths(self):
+        with self._condition:
+            return {priority: len(queue) for priority, queue in self._queues.items()}
+
+    def _head_class(self):
+        for priority in PRIORITY_CLASSES:
+            if self._queues[priority]:
+                return priority
+        return None
+
+    def _next_batch(self):
+        with self._condition:
+            while self._head_class() is None:
+                self._condition.wait()
+
+            # Streaming partials wait briefly so other sessions can join the batch
+            priority = self._head_class()
+            if priority == PRIORITY_STREAMING:
+                deadline = min(entry[2].submitted_at for entry in self._queues[priority]) + self.max_wait
+                while len(self._queues[priority]) < self.max_batch_size and self._head_class() == priority:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                priority = self._head_class()
+
+            queue = self._queues[priority]
+            _, _, first = heapq.heappop(queue)
+            self._virtual_time[priority] = max(self._virtual_time[priority], first.finish_tag - first.cost / max(first.weight, 1e-3))
+            batch = [first]
+
+            key = first.batch_key
+            if key is not None:
+                for entry in sorted(queue):
+                    if len(batch) >= self.max_batch_size:
+                        break
+                    if entry[2].batch_key == key:
+                        queue.remove(entry)
+                        batch.append(entry[2])
+                heapq.heapify(queue)
+
+            if not queue:
+                # Idle class: forget finish tags so returning clients start fresh
+                self._client_finish[priority].clear()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = [job for job in self._next_batch() if job.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                pipeline = self._pipeline_for(batch[0].model)
+                if len(batch) > 1 and pipeline is not None:
+                    self._run_batched(pipeline, batch)
+                else:
+                    for job in batch:
+                        self._run_single(job)
+            except Exception as e:
+                print(f"Error in batched inference ({len(batch)} jobs): {e}")
+                traceback.print_exc()
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+
+    def _pipeline_for(self, model):
+        if BatchedInferencePipeline is None:
+            return None
+        with self._condition:
+            if id(model) not in self._pipelines:
+                self._pipelines[id(model)] = BatchedInferencePipeline(model=model)
+            return self._pipelines[id(model)]
+
+    def _run_single(self, job):
+        try:
+            segments, info = job.model.transcribe(job.audio, **job.options)
+            result = TranscriptionResult(
+                [TranscribedSegment(segment.start, segment.end, segment.text) for segment in segments],
+                info.language,
+                info.language_probability,
+            )
+            job.future.set_result(result)
+        except Exception as e:
+            job.future.set_exception(e)
+
+    def _run_batched(self, pipeline, batch):
+        """Concatenate the windows and let the pipeline batch them as separate clips"""
+        clips = []
+        offset = 0
+        for job in batch:
+            clips.append({"start": offset, "end": offset + len(job.audio)})
+            offset += len(job.audio)
+        audio = np.concatenate([job.audio for job in batch])
+
+        # Every job in the batch has the same batch_key, so these options hold for all of them
+        options = batch[0].options
+        start_time = time.time()
+        segments, info = pipeline.transcribe(
+            audio,
+            language=options["language"],
+            task=options.get("task", "transcribe"),
+            beam_size=options.get("beam_size", 5),
+            initial_prompt=options.get("initial_prompt"),
+            condition_on_previous_text=options.get("condition_on_previous_text", True),
+            batch_size=len(batch),
+            vad_filter=False,
+            clip_timestamps=clips,
+            without_timestamps=False,
+        )
+
+        per_job = [[] for _ in batch]
+        clip_starts = [clip["start"] / SAMPLE_RATE for clip in clips]
+        for segment in segments:
+            index = 0
+            while index + 1 < len(clip_starts) and segment.start >= clip_starts[index + 1]:
+                index += 1
+            clip_start = clip_starts[index]
+            per_job[index].append(TranscribedSegment(segment.start - clip_start, segment.end - clip_start, segment.text))
+
+        print(f"Batched inference of {len(batch)} windows ({offset / SAMPLE_RATE:.1f}s audio) in {time.time() - start_time:.2f}s")
+
+        for job, job_segments in zip(batch, per_job):
+            job.future.set_result(TranscriptionResult(job_segments, info.language, info.language_probability))
@@ -0,0 +1,72 @@
+"""
+Registry owning every Whisper model instance in the process.
+
+Models are configured from the environment and loaded once per
+(model, device, compute type); every caller shares the same instance.
+"""
+import os
+import threading
+
+import ctranslate2
+from faster_whisper import WhisperModel
+
+
+_models = {}
+_lock = threading.Lock()
+
+
+def resolve_device(device=None):
+    """Map "auto" to cuda when a GPU is visible, otherwise cpu"""
+    device = device or os.environ.get("WHISPER_DEVICE", "auto")
+    if device != "auto":
+        return device
+    try:
+        return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+    except Exception:
+        return "cpu"
+
+
+def resolve_compute_type(device, compute_type=None):
+    """float16 on GPU, int8 on CPU unless explicitly configured"""
+    compute_type = compute_type or os.environ.get("WHISPER_COMPUTE_TYPE", "auto")
+    if compute_type != "auto":
+        return compute_type
+    return "float16" if device == "cuda" else "int8"
+
+
+def whisper_settings(model_size=None):
+    device = resolve_device()
+    return {
+        "model_size": model_size or os.environ.get("WHISPER_MODEL", "turbo"),
+        "device": device,
+        "compute_type": resolve_compute_type(device),
+        "cpu_threads": int(os.environ.get("WHISPER_CPU_THREADS", "0")),
+        "num_workers": int(os.environ.get("WHISPER_NUM_WORKERS", "1")),
+    }
+
+
+def get_whisper_model(model_size=None):
+    """Get or load the shared WhisperModel for the configured settings"""
+    settings = whisper_settings(model_size)
+    key = (settings["model_size"], settings["device"], settings["compute_type"])
+
+    with _lock:
+        if key not in _models:
+            print(f"Initializing Whisper model '{key[0]}' on {key[1]} ({key[2]})...")
+            _models[key] = WhisperModel(
+                settings["model_size"],
+                device=settings["device"],
+                compute_type=settings["compute_type"],
+                cpu_threads=settings["cpu_threads"],
+                num_workers=settings["num_workers"],
+            )
+            print("Whisper model initialized successfully")
+        return _models[key]
+
+
+def loaded_models():
+    with _lock:
+        return [
+            {"model": model_size, "device": device, "computeType": compute_type}
+            for model_size, device, compute_type in _models
+        ]
@@ -0,0 +1,194 @@
+"""
+Content-addressed cache of generated medical notes.
+
+Notes are keyed by a hash of the normalized transcript, the consultation
+reasons, the note model id and the prompt version, so retries, repeated
+end_session messages and /generate-note calls for the same consultation
+reuse one generation. Lookups go through an in-memory LRU, then an optional
+on-disk tier (NOTE_CACHE_DIR) evicted oldest-first once it exceeds
+NOTE_CACHE_DISK_MB. Concurrent requests for the same key share a single
+in-flight generation.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+NOTE_CACHE_SIZE = int(os.environ.get("NOTE_CACHE_SIZE", "128"))
+NOTE_CACHE_DIR = os.environ.get("NOTE_CACHE_DIR")
+NOTE_CACHE_DISK_BYTES = int(float(os.environ.get("NOTE_CACHE_DISK_MB", "256")) * 1024 * 1024)
+
+
+def note_cache_key(transcript, reasons, model_id, prompt_version):
+    normalized = {
+        "transcript": " ".join((transcript or "").split()).lower(),
+        "reasons": sorted(" ".join(str(reason).split()).lower() for reason in (reasons or [])),
+        "model": model_id,
+        "prompt": prompt_version,
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class DiskNoteStore:
+    """One UTF-8 file per note; least recently used files go first when over the byte budget"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._sizes = OrderedDict()
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith(".note"):
+                stat = os.stat(os.path.join(directory, name))
+                entries.append((stat.st_mtime, name[:-len(".note")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._sizes[key] = size
+        self.total_bytes = sum(self._sizes.values())
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.note")
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._sizes:
+                return None
+            self._sizes.move_to_end(key)
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as note_file:
+                note = note_file.read()
+            os.utime(self._path(key))
+            return note
+        except OSError:
+            with self._lock:
+                self.total_bytes -= self._sizes.pop(key, 0)
+            return None
+
+    def put(self, key, note):
+        data = note.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        temporary = self._path(key) + ".tmp"
+        with open(temporary, "wb") as note_file:
+            note_file.write(data)
+        os.replace(temporary, self._path(key))
+        with self._lock:
+            self.total_bytes += len(data) - self._sizes.pop(key, 0)
+            self._sizes[key] = len(data)
+            while self.total_bytes > self.max_bytes and self._sizes:
+                evicted, size = self._sizes.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(self._path(evicted))
+                except OSError:
+                    pass
+
+    def __len__(self):
+        return len(self._sizes)
+
+
+class NoteCache:
+    """Memory LRU in front of an optional DiskNoteStore, with in-flight deduplication"""
+
+    def __init__(self, max_entries=NOTE_CACHE_SIZE, directory=NOTE_CACHE_DIR, max_disk_bytes=NOTE_CACHE_DISK_BYTES):
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self.disk = None
+        if directory:
+            try:
+                self.disk = DiskNoteStore(directory, max_disk_bytes)
+            except OSError as e:
+                print(f"Note cache directory {directory} unavailable, caching in memory only: {e}")
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    def get(self, key):
+        note = self._memory.get(key)
+        if note is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return note
+        if self.disk is not None:
+            note = self.disk.get(key)
+            if note is not None:
+                self._remember(key, note)
+                self.disk_hits += 1
+                return note
+        self.misses += 1
+        return None
+
+    def put(self, key, note):
+        self._remember(key, note)
+        if self.disk is not None:
+            self._write_disk(key, note)
+
+    def _remember(self, key, note):
+        self._memory[key] = note
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def get_or_generate(self, key, generate):
+        """Return the cached note, or run `generate()` once for all concurrent callers.
+
+        Results of None are not cached. The shared generation is cancelled only
+        when every caller waiting on it has been cancelled.
+        """
+        note = self.get(key)
+        if note is not None:
+            return note
+
+        entry = self._inflight.get(key)
+        if entry is None:
+            entry = self._inflight[key] = {"task": asyncio.ensure_future(generate()), "waiters": 0}
+            entry["task"].add_done_callback(lambda task: self._finish(key, task))
+        else:
+            self.shared += 1
+
+        entry["waiters"] += 1
+        try:
+            return await asyncio.shield(entry["task"])
+        except asyncio.CancelledError:
+            if entry["waiters"] == 1 and not entry["task"].done():
+                entry["task"].cancel()
+            raise
+        finally:
+            entry["waiters"] -= 1
+
+    def _finish(self, key, task):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None or task.result() is None:
+            return
+        note = task.result()
+        self._remember(key, note)
+        if self.disk is not None:
+            asyncio.get_event_loop().run_in_executor(None, self._write_disk, key, note)
+
+    def _write_disk(self, key, note):
+        try:
+            self.disk.put(key, note)
+        except OSError as e:
+            print(f"Error writing note to disk cache: {e}")
+
+    def stats(self):
+        return {
+            "entries": len(self._memory),
+            "disk_entries": len(self.disk) if self.disk is not None else None,
+            "disk_bytes": self.disk.total_bytes if self.disk is not None else None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "shared_inflight": self.shared,
+            "inflight": len(self._inflight),
+        }
+
+
+note_cache = NoteCache()
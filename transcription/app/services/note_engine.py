@@ -0,0 +1,323 @@
+"""Continuous-batching note generation engine over the resident note model"""
+import asyncio
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+
+from app.services.note_model import note_model
+
+
+NOTE_MAX_BATCH_SIZE = int(os.environ.get("NOTE_MAX_BATCH_SIZE", "4"))
+NOTE_STREAM_TOKENS = int(os.environ.get("NOTE_STREAM_TOKENS", "8"))
+
+# Per-layer decode buffers Unsloth's fast inference path allocates for a fixed batch
+PAGED_CACHE_ATTRIBUTES = (
+    "paged_attention", "paged_attention_K", "paged_attention_V",
+    "temp_QA", "temp_KV", "temp_O", "RH_Q", "attention",
+)
+
+
+class NoteGenerationCancelled(Exception):
+    pass
+
+
+class NoteRequest:
+    def __init__(self, messages, max_new_tokens, cancel_event, on_text=None):
+        self.messages = messages
+        self.max_new_tokens = max_new_tokens
+        self.cancel_event = cancel_event
+        self.on_text = on_text
+        self.future = Future()
+        self.tokens = []
+        self.streamed_tokens = 0
+        self.streamed_chars = 0
+        self.position = 0
+        self.submitted_at = time.time()
+        self.started_at = None
+
+
+def _pad_left(tensor, length, dim):
+    import torch
+
+    missing = length - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = missing
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+
+class BatchState:
+    """KV cache, attention mask and per-row bookkeeping of the running batch"""
+
+    def __init__(self):
+        self.requests = []
+        self.cache = None
+        self.mask = None
+        # Rows were added or removed since the model last saw this cache
+        self.changed = True
+
+    def __len__(self):
+        return len(self.requests)
+
+    def add(self, request, cache, mask):
+        import torch
+
+        self.changed = True
+        if not self.requests:
+            self.requests, self.cache, self.mask = [request], cache, mask
+            return
+        length = max(self.mask.shape[1], mask.shape[1])
+        self.cache = tuple(
+            (
+                torch.cat([_pad_left(batch_key, length, 2), _pad_left(key, length, 2)], dim=0),
+                torch.cat([_pad_left(batch_value, length, 2), _pad_left(value, length, 2)], dim=0),
+            )
+            for (batch_key, batch_value), (key, value) in zip(self.cache, cache)
+        )
+        self.mask = torch.cat([_pad_left(self.mask, length, 1), _pad_left(mask, length, 1)], dim=0)
+        self.requests.append(request)
+
+    def keep(self, indices):
+        """Drop every row not in `indices` and trim padding columns no row uses any more"""
+        import torch
+
+        self.requests = [self.requests[index] for index in indices]
+        self.changed = True
+        if not self.requests:
+            self.cache = self.mask = None
+            return
+        rows = torch.tensor(indices, device=self.mask.device)
+        mask = self.mask.index_select(0, rows)
+        first = int(mask.any(dim=0).int().argmax())
+        self.mask = mask[:, first:]
+        self.cache = tuple(
+            (key.index_select(0, rows)[:, :, first:], value.index_select(0, rows)[:, :, first:])
+            for key, value in self.cache
+        )
+
+
+def _legacy_cache(past_key_values):
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return past_key_values
+
+
+def _reset_paged_cache(model):
+    """Drop Unsloth's decode buffers so the next step re-seeds them from the batch cache"""
+    for module in model.modules():
+        if hasattr(module, "paged_attention"):
+            for name in PAGED_CACHE_ATTRIBUTES:
+                if hasattr(module, name):
+                    delattr(module, name)
+
+
+def _model_cache(legacy):
+    try:
+        from transformers import DynamicCache
+        return DynamicCache.from_legacy_cache(legacy)
+    except ImportError:
+        return legacy
+
+
+class NoteEngine:
+    """Token-level continuous batching over the resident note model"""
+
+    def __init__(self, manager=note_model, max_batch_size=NOTE_MAX_BATCH_SIZE):
+        self.manager = manager
+        self.max_batch_size = max_batch_size
+        self._waiting = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+        self.completed = 0
+        self.generated_tokens = 0
+        self.decode_steps = 0
+        self.batch_size_total = 0
+
+    def submit(self, messages, max_new_tokens=1024, cancel_event=None, on_text=None):
+        """Queue a chat prompt; returns a concurrent.futures.Future resolving to the generated text.
+
+        `on_text(delta)` is called from the engine thread with each new piece of text.
+        """
+        request = NoteRequest(messages, max_new_tokens, cancel_event or threading.Event(), on_text)
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="note-engine", daemon=True)
+                self._thread.start()
+            self._waiting.append(request)
+            self._condition.notify()
+        return request.future
+
+    async def generate(self, messages, max_new_tokens=1024, on_text=None):
+        """Awaitable submit(); cancelling the caller removes the request from the batch.
+
+        `on_text(delta)` runs on the event loop, always before the awaited result.
+        """
+        cancel_event = threading.Event()
+        if on_text is not None:
+            loop = asyncio.get_event_loop()
+            callback = on_text
+            on_text = lambda delta: loop.call_soon_threadsafe(callback, delta)
+        future = self.submit(messages, max_new_tokens, cancel_event, on_text)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            cancel_event.set()
+            raise
+
+    def stats(self):
+        with self._condition:
+            waiting = len(self._waiting)
+        return {
+            "waiting": waiting,
+            "completed": self.completed,
+            "generated_tokens": self.generated_tokens,
+            "decode_steps": self.decode_steps,
+            "mean_batch_size": self.batch_size_total / self.decode_steps if self.decode_steps else 0.0,
+        }
+
+    def _take_waiting(self, limit):
+        with self._condition:
+            taken, self._waiting = self._waiting[:limit], self._waiting[limit:]
+        return [request for request in taken if request.future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        import torch
+
+        while True:
+            with self._condition:
+                while not self._waiting:
+                    self._condition.wait()
+            try:
+                with self.manager.acquire() as (model, tokenizer), torch.inference_mode():
+                    self._serve(model, tokenizer)
+            except Exception as e:
+                print(f"Error in note engine: {e}")
+                traceback.print_exc()
+                for request in self._take_waiting(len(self._waiting)):
+                    request.future.set_exception(e)
+
+    def _serve(self, model, tokenizer):
+        """Decode until nothing is running or waiting; requests join between steps"""
+        eos_ids = self._eos_ids(model, tokenizer)
+        batch = BatchState()
+        try:
+            while True:
+                if len(batch) < self.max_batch_size:
+                    for request in self._take_waiting(self.max_batch_size - len(batch)):
+                        try:
+                            self._prefill(model, tokenizer, batch, request)
+                        except Exception as e:
+                            request.future.set_exception(e)
+                self._retire(tokenizer, batch, eos_ids)
+                if not batch:
+                    with self._condition:
+                        if not self._waiting:
+                            return
+                    continue
+
+                try:
+                    self._step(model, batch)
+                except Exception as e:
+                    self._fail(batch, e)
+                    batch = BatchState()
+        except Exception as e:
+            # Anything else (e.g. decoding in _retire) must not leave running requests unresolved
+            self._fail(batch, e)
+            raise
+
+    def _fail(self, batch, error):
+        for request in batch.requests:
+            if not request.future.done():
+                request.future.set_exception(error)
+
+    def _eos_ids(self, model, tokenizer):
+        eos_ids = {tokenizer.eos_token_id}
+        configured = getattr(getattr(model, "generation_config", None), "eos_token_id", None)
+        if isinstance(configured, (list, tuple)):
+            eos_ids.update(configured)
+        elif configured is not None:
+            eos_ids.add(configured)
+        eos_ids.discard(None)
+        return eos_ids
+
+    def _prefill(self, model, tokenizer, batch, request):
+        import torch
+
+        request.started_at = time.time()
+        input_ids = tokenizer.apply_chat_template(
+            request.messages, tokenize = True, add_generation_prompt = True, return_tensors = "pt"
+        ).to(model.device)
+        mask = torch.ones_like(input_ids)
+        output = model(input_ids=input_ids, attention_mask=mask, use_cache=True, num_logits_to_keep=1)
+        request.tokens.append(int(output.logits[0, -1].argmax()))
+        request.position = input_ids.shape[1]
+        batch.add(request, _legacy_cache(output.past_key_values), mask)
+
+    def _step(self, model, batch):
+        import torch
+
+        device = batch.mask.device
+        input_ids = torch.tensor([[request.tokens[-1]] for request in batch.requests], device=device)
+        position_ids = torch.tensor([[request.position] for request in batch.requests], device=device)
+        mask = torch.cat([batch.mask, batch.mask.new_ones((len(batch), 1))], dim=1)
+        if batch.changed:
+            # Unsloth keeps its own KV copy sized for the batch it first saw and
+            # ignores past_key_values after that, so it must be rebuilt on every change
+            _reset_paged_cache(model)
+            batch.changed = False
+
+        output = model(
+            input_ids=input_ids,
+            attention_mask=mask,
+            position_ids=position_ids,
+            past_key_values=_model_cache(batch.cache),
+            use_cache=True,
+        )
+        batch.cache = _legacy_cache(output.past_key_values)
+        batch.mask = mask
+        next_tokens = output.logits[:, -1].argmax(dim=-1).tolist()
+        for request, token in zip(batch.requests, next_tokens):
+            request.tokens.append(int(token))
+            request.position += 1
+
+        self.decode_steps += 1
+        self.batch_size_total += len(batch)
+        self.generated_tokens += len(batch)
+
+    def _retire(self, tokenizer, batch, eos_ids):
+        keep = []
+        for index, request in enumerate(batch.requests):
+            if request.cancel_event.is_set():
+                request.future.set_exception(NoteGenerationCancelled())
+            elif request.tokens[-1] in eos_ids or len(request.tokens) >= request.max_new_tokens:
+                tokens = request.tokens[:-1] if request.tokens[-1] in eos_ids else request.tokens
+                text = tokenizer.decode(tokens, skip_special_tokens=True)
+                self._stream(request, text)
+                request.future.set_result(text)
+                self.completed += 1
+            else:
+                keep.append(index)
+                if request.on_text is not None and len(request.tokens) - request.streamed_tokens >= NOTE_STREAM_TOKENS:
+                    text = tokenizer.decode(request.tokens, skip_special_tokens=True)
+                    # A trailing replacement character means a multi-byte character is still incomplete
+                    if not text.endswith("\ufffd"):
+                        request.streamed_tokens = len(request.tokens)
+                        self._stream(request, text)
+        if len(keep) != len(batch):
+            batch.keep(keep)
+
+    def _stream(self, request, text):
+        if request.on_text is None or len(text) <= request.streamed_chars:
+            return
+        delta, request.streamed_chars = text[request.streamed_chars:], len(text)
+        try:
+            request.on_text(delta)
+        except Exception as e:
+            print(f"Error streaming note text: {e}")
+
+
+note_engine = NoteEngine()
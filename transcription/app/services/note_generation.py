@@ -1,43 +1,36 @@
 """
 Service for generating medical notes using AWS Bedrock and Claude.
 """
+import asyncio
 import os
 import json
-
-from unsloth import FastLanguageModel
 import time
 import traceback
 
+from app.services.note_model import note_model
+from app.services.note_engine import note_engine
+from app.services.note_cache import note_cache, note_cache_key
+
+
+NOTE_MAX_NEW_TOKENS = 1024
+# Bump whenever note_messages() changes so cached notes from the old prompt are not reused
+NOTE_PROMPT_VERSION = "1"
 
-_llm_model = None
-_llm_tokenizer = None
 
 def get_llm_model():
-    """Get or initialize the LLM model singleton"""
-    global _llm_model, _llm_tokenizer
-    if _llm_model is None or _llm_tokenizer is None:
-        print("Initializing LLM model...")
-        start_time = time.time()
-        try:
-            _llm_model, _llm_tokenizer = FastLanguageModel.from_pretrained(
-                model_name = 'Simranjit/llama8bnabla',
-                max_seq_length = 12000,
-                load_in_4bit = True,
-                token = os.environ.get('HF_TOKEN')
-            )
-            FastLanguageModel.for_inference(_llm_model)
-            print(f"LLM model initialized successfully in {time.time() - start_time:.2f} seconds")
-        except Exception as e:
-            print(f"Error initializing LLM model: {e}")
-            raise
-    return _llm_model, _llm_tokenizer
-
-async def generate_medical_note(transcript: str, reasons: list) -> str:
+    """Get the resident LLM model and tokenizer, loading them if needed"""
+    return note_model.load()
+
+async def generate_medical_note(transcript: str, reasons: list, on_delta=None) -> str:
     """
     Generate a medical note from transcript and consultation reasons.
+    `on_delta(text)` receives the note incrementally while it is generated.
     """
     try:
-        note = generate_unsloth_note(transcript)
+        key = note_cache_key(transcript, reasons, note_model.settings["model_name"], NOTE_PROMPT_VERSION)
+        note = await note_cache.get_or_generate(key, lambda: run_note_job(transcript, on_delta))
+        if note is None:
+            return generate_fallback_note(transcript, reasons)
         print("your note is ready!!!!!", note)
         return note
     except Exception as e:
@@ -49,6 +42,38 @@ async def generate_medical_note(transcript: str, reasons: list) -> str:
         return generate_fallback_note(transcript, reasons)
 
 
+def note_messages(transcript):
+    return [
+        {"role": "system", "content": "Please generate a detailed and thorough medical note using this transcript."},
+        {"role": "user", "content": transcript}
+    ]
+
+
+def _checked_note(note):
+    if not note or len(note) < 50:
+        print("Generated note was too short or empty, using fallback")
+        return None
+    return note
+
+
+async def run_note_job(transcript: str, on_delta=None):
+    """Generate through the batching note engine, off the event loop.
+
+    Returns None when no usable note can be generated, so callers fall back
+    (and nothing gets cached). Cancelling the awaiting task (e.g.
+    asyncio.wait_for timing out) drops the request from the engine's batch
+    at the next token.
+    """
+    if not transcript or len(transcript.split()) < 10:
+        return None
+    try:
+        note = await note_engine.generate(note_messages(transcript), NOTE_MAX_NEW_TOKENS, on_delta)
+    except asyncio.CancelledError:
+        print("Note generation cancelled")
+        raise
+    return _checked_note(note)
+
+
 def generate_fallback_note(transcript: str, reasons: list) -> str:
     """Generate a simple fallback note when AI generation fails"""
     try:
@@ -73,46 +98,13 @@ La transcription ci-dessus est fournie pour référence.
         return f"# Transcription\n\n{transcript}"
 
 def generate_unsloth_note(transcript):
-    """Generate a note using the Unsloth model with error handling"""
+    """Blocking variant for non-async callers; shares the engine's batch"""
     if not transcript or len(transcript.split()) < 10:
         return generate_fallback_note(transcript, [])
 
     try:
-        model, tokenizer = FastLanguageModel.from_pretrained(
-            model_name = os.environ.get('MODEL_NAME', "Simranjit/llama8bnabla"),
-            max_seq_length = 12000,
-            load_in_4bit = True,
-            token = os.environ.get('HF_TOKEN')
-        )
-
-
-        from transformers import TextStreamer
-        FastLanguageModel.for_inference(model)
-
-        messages = [
-            {"role": "system", "content": "Please generate a detailed and thorough medical note using this transcript."},
-            {"role": "user", "content": transcript}
-        ]
-
-        inputs = tokenizer.apply_chat_template(messages, tokenize = True, add_generation_prompt = True, return_tensors = "pt").to("cuda")
-
-        text_streamer = TextStreamer(tokenizer)
-        g = model.generate(
-            input_ids = inputs,
-            streamer = text_streamer,
-            max_new_tokens = 1024,
-            use_cache = True
-        )
-
-        len_inp = len(tokenizer.apply_chat_template(messages, skip_special_tokens=False, tokenize = False, add_generation_prompt = False))
-        note = tokenizer.decode(g[0], skip_special_tokens=False)[len_inp:]
-
-
-        if not note or len(note) < 50:
-            print("Generated note was too short or empty, using fallback")
-            return generate_fallback_note(transcript, [])
-
-        return note
+        note = _checked_note(note_engine.submit(note_messages(transcript), NOTE_MAX_NEW_TOKENS).result())
+        return note if note is not None else generate_fallback_note(transcript, [])
     except Exception as e:
         print(f"Error in generate_unsloth_note: {e}")
         traceback.print_exc()
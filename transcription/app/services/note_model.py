@@ -0,0 +1,174 @@
+"""
+Lifecycle of the resident note-generation LLM.
+
+The model is loaded once (at startup when possible), warmed up with a short
+generation so the first real note does not pay for kernel compilation and
+cache allocation, and then shared by every note request. When
+NOTE_MODEL_IDLE_UNLOAD_SECONDS is set, the model is released after that long
+without use and reloaded on the next request.
+"""
+import asyncio
+import gc
+import os
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from unsloth import FastLanguageModel
+
+from app.services.timer_service import timer_service
+
+
+STATE_UNLOADED = "unloaded"
+STATE_LOADING = "loading"
+STATE_READY = "ready"
+STATE_ERROR = "error"
+
+
+def note_model_settings():
+    return {
+        "model_name": os.environ.get("MODEL_NAME", "Simranjit/llama8bnabla"),
+        "max_seq_length": int(os.environ.get("NOTE_MODEL_MAX_SEQ_LENGTH", "12000")),
+        "load_in_4bit": os.environ.get("NOTE_MODEL_LOAD_IN_4BIT", "1") != "0",
+        "warmup": os.environ.get("NOTE_MODEL_WARMUP", "1") != "0",
+        "idle_unload_seconds": float(os.environ.get("NOTE_MODEL_IDLE_UNLOAD_SECONDS", "0")),
+    }
+
+
+class NoteModelManager:
+    """Loads, warms up, shares and (optionally) idle-unloads the note LLM"""
+
+    def __init__(self, settings=None):
+        self.settings = settings or note_model_settings()
+        self.state = STATE_UNLOADED
+        self.error = None
+        self.model = None
+        self.tokenizer = None
+        self.loaded_at = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.last_used = time.time()
+        self.unloaded_idle = False
+        self._in_use = 0
+        self._lock = threading.RLock()
+
+    @property
+    def ready(self):
+        """Loaded, or released only for idleness and able to reload on demand"""
+        return self.state == STATE_READY or (self.state == STATE_UNLOADED and self.unloaded_idle)
+
+    def load(self):
+        """Load and warm up the model if it is not resident; returns (model, tokenizer)"""
+        with self._lock:
+            if self.state == STATE_READY:
+                return self.model, self.tokenizer
+
+            self.state = STATE_LOADING
+            print(f"Loading note model {self.settings['model_name']}...")
+            start_time = time.time()
+            try:
+                model, tokenizer = FastLanguageModel.from_pretrained(
+                    model_name = self.settings["model_name"],
+                    max_seq_length = self.settings["max_seq_length"],
+                    load_in_4bit = self.settings["load_in_4bit"],
+                    token = os.environ.get('HF_TOKEN')
+                )
+                FastLanguageModel.for_inference(model)
+                self.load_seconds = time.time() - start_time
+
+                if self.settings["warmup"]:
+                    self._warm_up(model, tokenizer)
+
+                self.model, self.tokenizer = model, tokenizer
+                self.state = STATE_READY
+                self.error = None
+                self.unloaded_idle = False
+                self.loaded_at = self.last_used = time.time()
+                print(f"Note model ready in {time.time() - start_time:.2f} seconds")
+                return model, tokenizer
+            except Exception as e:
+                self.state = STATE_ERROR
+                self.error = str(e)
+                print(f"Error loading note model: {e}")
+                traceback.print_exc()
+                raise
+
+    def _warm_up(self, model, tokenizer):
+        start_time = time.time()
+        messages = [
+            {"role": "system", "content": "Please generate a detailed and thorough medical note using this transcript."},
+            {"role": "user", "content": "Patient reports a mild headache since yesterday."}
+        ]
+        inputs = tokenizer.apply_chat_template(messages, tokenize = True, add_generation_prompt = True, return_tensors = "pt").to(model.device)
+        model.generate(input_ids = inputs, max_new_tokens = 8, use_cache = True)
+        self.warmup_seconds = time.time() - start_time
+        print(f"Note model warm-up generation took {self.warmup_seconds:.2f} seconds")
+
+    @contextmanager
+    def acquire(self):
+        """Use the resident model (loading it on demand); it is not unloaded while held"""
+        with self._lock:
+            self._in_use += 1
+        try:
+            yield self.load()
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                self.last_used = time.time()
+
+    def unload(self, idle=False):
+        with self._lock:
+            if self._in_use or self.state != STATE_READY:
+                return False
+            self.model = None
+            self.tokenizer = None
+            self.state = STATE_UNLOADED
+            self.unloaded_idle = idle
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except Exception:
+            pass
+        print("Note model unloaded" + (" after idle period" if idle else ""))
+        return True
+
+    def _check_idle(self):
+        """Timer callback: unload once idle long enough; returns the delay to the next check"""
+        idle_seconds = self.settings["idle_unload_seconds"]
+        if self.state != STATE_READY or self._in_use:
+            return idle_seconds
+        idle_for = time.time() - self.last_used
+        if idle_for < idle_seconds:
+            return idle_seconds - idle_for
+        self.unload(idle=True)
+        return idle_seconds
+
+    async def start(self):
+        """Load and warm up in the background at startup, and arm the idle unloader"""
+        loop = asyncio.get_event_loop()
+        if self.settings["idle_unload_seconds"] > 0:
+            timer_service.schedule(("note_model_idle",), self.settings["idle_unload_seconds"], self._check_idle)
+        try:
+            await loop.run_in_executor(None, self.load)
+        except Exception as e:
+            print(f"Note model will be loaded on first use: {e}")
+
+    def status(self):
+        return {
+            "model": self.settings["model_name"],
+            "state": self.state,
+            "ready": self.ready,
+            "error": self.error,
+            "in_use": self._in_use,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "idle_unload_seconds": self.settings["idle_unload_seconds"] or None,
+            "last_used": self.last_used,
+        }
+
+
+note_model = NoteModelManager()
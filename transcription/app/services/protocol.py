@@ -0,0 +1,168 @@
+"""
+WebSocket message codec.
+
+Converts between the server's snake_case dicts and the client's camelCase
+messages, and serializes them. Key conversions are cached, and messages of
+known types only recurse into the fields that can hold nested objects.
+JSON goes through orjson when it is installed; connections may also ask
+for MessagePack (`?codec=msgpack`), which is sent as binary frames.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+_camel_keys = {}
+_snake_keys = {}
+
+
+def to_camel(key):
+    camel_key = _camel_keys.get(key)
+    if camel_key is None:
+        parts = key.split('_')
+        camel_key = parts[0] + ''.join(x.title() for x in parts[1:])
+        _camel_keys[key] = camel_key
+    return camel_key
+
+
+def to_snake(key):
+    snake_key = _snake_keys.get(key)
+    if snake_key is None:
+        snake_key = ''.join(['_' + c.lower() if c.isupper() else c for c in key]).lstrip('_')
+        _snake_keys[key] = snake_key
+    return snake_key
+
+
+# Message type -> fields whose values may hold dicts that need key conversion.
+# Every other field of a known type is copied as-is.
+OUTBOUND_SCHEMAS = {
+    "app-ping": (),
+    "chunk-ack": (),
+    "chunk-acks": (),
+    "error": (),
+    "keep-alive-response": (),
+    "medical-note": (),
+    "medical-note-delta": (),
+    "metadata-updated": (),
+    "processing-heartbeat": (),
+    "processing-status": (),
+    "session-deleted": (),
+    "session-ended": (),
+    "session-pending-completion": (),
+    "transcription-update": (),
+    "session-created": ("capabilities",),
+    "session-resumed": ("capabilities", "segments"),
+    "reconnection-info": ("active_sessions", "activeSessions"),
+}
+
+INBOUND_SCHEMAS = {
+    "audio-chunk": (),
+    "delete-session": (),
+    "end-session": (),
+    "keep-alive": (),
+    "transcript-ack": (),
+    "start-session": ("metadata", "capabilities"),
+    "resume-session": ("capabilities",),
+    "update-session-metadata": ("metadata",),
+}
+
+
+def _convert(data, convert_key):
+    if not isinstance(data, dict):
+        return data
+
+    result = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            result[convert_key(key)] = _convert(value, convert_key)
+        elif isinstance(value, list):
+            result[convert_key(key)] = [_convert(item, convert_key) if isinstance(item, dict) else item for item in value]
+        else:
+            result[convert_key(key)] = value
+    return result
+
+
+def _convert_message(data, convert_key, schemas):
+    message_type = data.get("type")
+    nested = schemas.get(message_type.replace("_", "-")) if isinstance(message_type, str) else None
+    if nested is None:
+        return _convert(data, convert_key)
+
+    result = {}
+    for key, value in data.items():
+        if key in nested:
+            if isinstance(value, list):
+                value = [_convert(item, convert_key) for item in value]
+            else:
+                value = _convert(value, convert_key)
+        result[convert_key(key)] = value
+    return result
+
+
+def to_frontend_format(data):
+    if not isinstance(data, dict):
+        return data
+    return _convert_message(data, to_camel, OUTBOUND_SCHEMAS)
+
+
+def from_frontend_format(data):
+    if not isinstance(data, dict):
+        return data
+    return _convert_message(data, to_snake, INBOUND_SCHEMAS)
+
+
+def dumps_json(data):
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(data)
+
+
+def loads_json(text):
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def is_msgpack_map(data):
+    """MessagePack messages are always maps: fixmap (0x80-0x8f), map16 or map32"""
+    return len(data) > 0 and (0x80 <= data[0] <= 0x8f or data[0] in (0xde, 0xdf))
+
+
+class MessageCodec:
+    """Per-connection encoder/decoder for protocol messages"""
+
+    def __init__(self, name="json"):
+        self.name = "msgpack" if name == "msgpack" and msgpack is not None else "json"
+
+    @property
+    def binary(self):
+        return self.name == "msgpack"
+
+    def encode(self, data):
+        """Frontend-format a server message; returns str for JSON, bytes for MessagePack"""
+        frontend_data = to_frontend_format(data)
+        if "type" in data:
+            frontend_data["type"] = data["type"].replace("_", "-")
+        if self.binary:
+            return msgpack.packb(frontend_data, use_bin_type=True)
+        return dumps_json(frontend_data)
+
+    def decode(self, payload):
+        """Decode a client message (text or MessagePack bytes) into server format"""
+        if isinstance(payload, str):
+            data = loads_json(payload)
+        else:
+            data = msgpack.unpackb(payload, raw=False)
+        return from_frontend_format(data)
+
+
+def negotiate_codec(requested):
+    return MessageCodec(requested or "json")
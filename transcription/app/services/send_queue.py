@@ -0,0 +1,167 @@
+"""Per-connection outbound message queue with control, update and heartbeat priority classes"""
+import asyncio
+import os
+import time
+from collections import deque
+
+from app.services.transcript_store import merge_deltas
+
+
+SEND_QUEUE_SIZE = int(os.environ.get("SEND_QUEUE_SIZE", 256))
+
+PRIORITY_CONTROL = 0
+PRIORITY_UPDATE = 1
+PRIORITY_HEARTBEAT = 2
+SEND_PRIORITIES = (PRIORITY_CONTROL, PRIORITY_UPDATE, PRIORITY_HEARTBEAT)
+PRIORITY_NAMES = {PRIORITY_CONTROL: "control", PRIORITY_UPDATE: "update", PRIORITY_HEARTBEAT: "heartbeat"}
+
+COALESCED_TYPES = {"transcription-update"}
+HEARTBEAT_TYPES = {"app-ping", "processing-heartbeat"}
+
+
+def _message_type(message):
+    message_type = message.get("type")
+    return message_type.replace("_", "-") if isinstance(message_type, str) else None
+
+
+def message_priority(message):
+    message_type = _message_type(message)
+    if message_type in HEARTBEAT_TYPES:
+        return PRIORITY_HEARTBEAT
+    if message_type in COALESCED_TYPES:
+        return PRIORITY_UPDATE
+    return PRIORITY_CONTROL
+
+
+class OutboundQueue:
+    """Bounded priority queue with one writer task calling `send(message)`"""
+
+    def __init__(self, send, max_size=SEND_QUEUE_SIZE):
+        self._send = send
+        self.max_size = max_size
+        self.pressure_threshold = max(1, max_size // 2)
+        self._queues = {priority: deque() for priority in SEND_PRIORITIES}
+        self._coalescing = {}
+        self._in_flight = None
+        self._ready = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.last_send_seconds = 0.0
+
+        self._writer = asyncio.create_task(self._run())
+
+    @property
+    def depth(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    @property
+    def under_pressure(self):
+        return self.depth >= self.pressure_threshold
+
+    def put(self, message):
+        """Enqueue without blocking; returns False if the message was dropped"""
+        priority = message_priority(message)
+
+        if priority == PRIORITY_UPDATE:
+            key = (_message_type(message), message.get("sessionId") or message.get("session_id"))
+            entry = self._coalescing.get(key)
+            if entry is not None:
+                entry[0] = merge_deltas(entry[0], message)
+                self.coalesced += 1
+                return True
+            entry = [message]
+            self._coalescing[key] = entry
+        else:
+            if priority == PRIORITY_HEARTBEAT and (self.under_pressure or self.depth >= self.max_size):
+                self.dropped += 1
+                return False
+            entry = [message]
+
+        self._queues[priority].append(entry)
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        if self.under_pressure:
+            self._writable.clear()
+        self._ready.set()
+        return True
+
+    async def wait_writable(self, timeout=None):
+        """Wait until the queue drains below its pressure threshold; True if it did"""
+        if self._writable.is_set():
+            return True
+        try:
+            await asyncio.wait_for(self._writable.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def metrics(self):
+        return {
+            "depth": self.depth,
+            "depth_by_priority": {PRIORITY_NAMES[priority]: len(queue) for priority, queue in self._queues.items()},
+            "max_depth": self.max_depth,
+            "under_pressure": self.under_pressure,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "last_send_seconds": self.last_send_seconds,
+        }
+
+    def close(self):
+        """Stop the writer; returns the control messages it had not delivered"""
+        if not self._writer.done():
+            self._writer.cancel()
+        self._writable.set()
+
+        # A message interrupted mid-send may not have reached the client either
+        undelivered = [entry[0] for entry in self._queues[PRIORITY_CONTROL]]
+        if self._in_flight is not None and message_priority(self._in_flight) == PRIORITY_CONTROL:
+            undelivered.insert(0, self._in_flight)
+        self._in_flight = None
+        for queue in self._queues.values():
+            queue.clear()
+        self._coalescing.clear()
+        return undelivered
+
+    def _pop(self):
+        for priority in SEND_PRIORITIES:
+            queue = self._queues[priority]
+            if queue:
+                entry = queue.popleft()
+                if priority == PRIORITY_UPDATE:
+                    message = entry[0]
+                    key = (_message_type(message), message.get("sessionId") or message.get("session_id"))
+                    if self._coalescing.get(key) is entry:
+                        del self._coalescing[key]
+                return entry[0]
+        return None
+
+    async def _run(self):
+        while True:
+            message = self._pop()
+            if message is None:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            start_time = time.time()
+            self._in_flight = message
+            try:
+                await self._send(message)
+                self.sent += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in outbound writer: {e}")
+            self._in_flight = None
+            self.last_send_seconds = time.time() - start_time
+
+            if not self.under_pressure:
+                self._writable.set()
@@ -0,0 +1,84 @@
+"""
+Registry of recording/processing sessions with secondary indexes.
+
+Maps session_id to SessionState like the plain dict it replaces, but also
+keeps sessions indexed by client_id and by status, plus a heap ordered by
+start time for expiry. Lookups by client or status cost O(results)
+instead of a scan over every session kept in memory.
+"""
+import heapq
+from collections.abc import MutableMapping
+
+
+INDEXED_FIELDS = ("client_id", "status")
+
+
+class SessionRegistry(MutableMapping):
+    def __init__(self):
+        self._sessions = {}
+        # field -> value -> {session_id: None} (dicts keep insertion order)
+        self._indexes = {field: {} for field in INDEXED_FIELDS}
+        self._by_age = []
+
+    def __getitem__(self, session_id):
+        return self._sessions[session_id]
+
+    def __setitem__(self, session_id, session):
+        if session_id in self._sessions:
+            del self[session_id]
+        session._registry = self
+        self._sessions[session_id] = session
+        for field in INDEXED_FIELDS:
+            self._reindex(session_id, field, None, getattr(session, field))
+        heapq.heappush(self._by_age, (session.start_time, session_id))
+
+    def __delitem__(self, session_id):
+        session = self._sessions.pop(session_id)
+        for field in INDEXED_FIELDS:
+            self._reindex(session_id, field, getattr(session, field), None)
+        session._registry = None
+        # Age entries of removed sessions are skipped lazily; rebuild if they pile up
+        if len(self._by_age) > 2 * len(self._sessions) + 64:
+            self._by_age = [(session.start_time, sid) for sid, session in self._sessions.items()]
+            heapq.heapify(self._by_age)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def __iter__(self):
+        return iter(self._sessions)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _reindex(self, session_id, field, old, new):
+        index = self._indexes[field]
+        if old is not None and old in index:
+            index[old].pop(session_id, None)
+            if not index[old]:
+                del index[old]
+        if new is not None:
+            index.setdefault(new, {})[session_id] = None
+
+    def _lookup(self, field, value):
+        return [(session_id, self._sessions[session_id]) for session_id in self._indexes[field].get(value, ())]
+
+    def for_client(self, client_id):
+        """(session_id, session) pairs owned by a client, oldest first"""
+        return self._lookup("client_id", client_id)
+
+    def with_status(self, status):
+        """(session_id, session) pairs currently in `status`"""
+        return self._lookup("status", status)
+
+    def pop_older_than(self, cutoff):
+        """Remove and return (session_id, session) pairs that started before `cutoff`"""
+        expired = []
+        while self._by_age and self._by_age[0][0] < cutoff:
+            start_time, session_id = heapq.heappop(self._by_age)
+            session = self._sessions.get(session_id)
+            if session is None or session.start_time != start_time:
+                continue
+            del self[session_id]
+            expired.append((session_id, session))
+        return expired
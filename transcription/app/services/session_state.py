@@ -0,0 +1,113 @@
+"""
+Typed per-session state.
+
+Replaces the free-form session dicts: fixed attributes in `__slots__`, a
+bounded history of lifecycle events, and a report of the memory each
+session holds (encoded audio, decoded PCM window, decoder, transcript, note).
+"""
+import os
+import sys
+import time
+from collections import deque
+
+from app.services.chunk_ingest import ChunkSequencer, AckBatcher
+from app.services.chunk_store import get_chunk_store
+from app.services.streaming_transcription import get_session
+
+
+SESSION_EVENT_HISTORY = int(os.environ.get("SESSION_EVENT_HISTORY", 32))
+
+
+class SessionState:
+    __slots__ = (
+        "session_id", "_client_id", "_status", "_registry",
+        "handle", "audio_format", "metadata",
+        "transcript", "medical_note", "error",
+        "start_time", "end_time", "reconnect_time", "last_end_attempt",
+        "processing_start_time", "processing_end_time",
+        "pending_finalization", "events", "ingest", "acks",
+    )
+
+    def __init__(self, session_id, client_id, handle=None, audio_format="webm", metadata=None, start_time=None):
+        self._registry = None
+        self.session_id = session_id
+        self._client_id = client_id
+        self._status = "recording"
+        self.handle = handle
+        self.audio_format = audio_format
+        self.metadata = metadata if isinstance(metadata, dict) else {}
+        self.transcript = ""
+        self.medical_note = ""
+        self.error = None
+        self.start_time = start_time if start_time is not None else time.time()
+        self.end_time = 0
+        self.reconnect_time = None
+        self.last_end_attempt = None
+        self.processing_start_time = None
+        self.processing_end_time = None
+        self.pending_finalization = False
+        self.events = deque(maxlen=SESSION_EVENT_HISTORY)
+        self.ingest = ChunkSequencer()
+        self.acks = AckBatcher()
+
+    # client_id and status are indexed by the SessionRegistry, so assignments go through it
+    @property
+    def client_id(self):
+        return self._client_id
+
+    @client_id.setter
+    def client_id(self, value):
+        old, self._client_id = self._client_id, value
+        if self._registry is not None:
+            self._registry._reindex(self.session_id, "client_id", old, value)
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, value):
+        old, self._status = self._status, value
+        if self._registry is not None:
+            self._registry._reindex(self.session_id, "status", old, value)
+
+    def record_event(self, kind, **details):
+        """Append to the bounded event history (oldest events fall off)"""
+        self.events.append({"type": kind, "time": time.time(), **details})
+
+    def memory_usage(self):
+        """Approximate bytes held by this session, by category"""
+        store = get_chunk_store(self.session_id)
+        audio_bytes = store.total_bytes if store is not None else 0
+        streaming = get_session(self.session_id)
+        streaming_usage = streaming.memory_usage() if streaming is not None else {"pcm_bytes": 0, "decoder_bytes": 0}
+        transcript_bytes = len(self.transcript.encode("utf-8")) if self.transcript else 0
+        note_bytes = len(self.medical_note.encode("utf-8")) if isinstance(self.medical_note, str) else 0
+        state_bytes = sys.getsizeof(self) + sys.getsizeof(self.events) + sys.getsizeof(self.metadata)
+        return {
+            "audio_bytes": audio_bytes,
+            **streaming_usage,
+            "transcript_bytes": transcript_bytes,
+            "note_bytes": note_bytes,
+            "state_bytes": state_bytes,
+            "total_bytes": audio_bytes + sum(streaming_usage.values()) + transcript_bytes + note_bytes + state_bytes,
+        }
+
+
+def aggregate_memory_usage(sessions):
+    """Sum memory_usage() over (session_id, SessionState) pairs, overall and per status"""
+    totals = {
+        "sessions": 0, "audio_bytes": 0, "pcm_bytes": 0, "decoder_bytes": 0,
+        "transcript_bytes": 0, "note_bytes": 0, "state_bytes": 0, "total_bytes": 0,
+    }
+    by_status = {}
+    for _, session in sessions:
+        usage = session.memory_usage()
+        status_totals = by_status.setdefault(session.status, {"sessions": 0, "total_bytes": 0})
+        status_totals["sessions"] += 1
+        status_totals["total_bytes"] += usage["total_bytes"]
+        totals["sessions"] += 1
+        for key, value in usage.items():
+            totals[key] += value
+    totals["by_status"] = by_status
+    return totals
@@ -1,225 +1,477 @@
 import os
 import time
-import tempfile
-import subprocess
-from pathlib import Path
-from faster_whisper import WhisperModel
+import bisect
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from io import BytesIO
+import numpy as np
+from app.services.model_registry import get_whisper_model
+from app.services.inference_scheduler import InferenceScheduler, PRIORITY_STREAMING, PRIORITY_FINALIZE
+from app.services.audio_decoder import create_decoder
+from app.services.vad import EnergyVAD
+from app.services.audio_buffer import PCMBuffer
+from app.services.transcript_store import TranscriptStore
 
 
-_model = None
+# Queued after the last chunk by finalize(): the worker decodes what precedes it and exits
+STOP_WORKER = object()
+
 
 def get_model():
-    """Get or initialize the WhisperModel singleton"""
-    global _model
-    if _model is None:
-        print("Initializing WhisperModel...")
-        _model = WhisperModel("small", device="cuda", compute_type="float16")
-        print("WhisperModel initialized successfully")
-    return _model
+    """Get the shared WhisperModel from the model registry"""
+    return get_whisper_model()
+
+
+_scheduler = None
+
+def get_scheduler():
+    """Get or initialize the shared inference scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = InferenceScheduler(
+            get_model(),
+            max_batch_size=int(os.environ.get("WHISPER_MAX_BATCH_SIZE", "8")),
+            max_wait_ms=float(os.environ.get("WHISPER_MAX_BATCH_WAIT_MS", "50")),
+            concurrency=int(os.environ.get("INFERENCE_CONCURRENCY", "1")),
+        )
+    return _scheduler
 
 
 class StreamingTranscriptionSession:
     """Manages a streaming transcription session with in-memory chunk handling"""
 
-    def __init__(self, session_id):
+    def __init__(self, session_id, chunk_store, audio_format="webm"):
         self.session_id = session_id
-        self.model = get_model()
-        self.accumulated_text = ""
-        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.chunk_store = chunk_store
+        self.audio_format = audio_format
+        self.scheduler = get_scheduler()
         self.last_transcription_time = 0
         self.transcription_interval = 8
         self.pending_transcription = False
 
-
-        self.audio_buffer = BytesIO()
+        # Sliding-window state: audio before committed_until is never re-transcribed
+        self.sample_rate = 16000
+        self.max_window_seconds = 30
+        self.stability_margin = 1.0
+        self.prompt_chars = 200
+        self.committed_segments = []
+        self.committed_until = 0.0
+        self.previous_hypothesis = []
+
+        # Language is detected until one pass is confident, then pinned so later windows can be batched
+        self.language = None
+        self.language_lock_probability = 0.8
+
+        # Versioned segment view sent to clients as deltas
+        self.transcript = TranscriptStore()
+        self.published_committed = 0
+        self.sent_version = 0
+        self.acked_version = 0
+
+        # Decoded PCM with a bounded in-memory horizon, older audio spills to disk
+        self.decoder = create_decoder(audio_format, sample_rate=self.sample_rate)
+        self.pcm = PCMBuffer(sample_rate=self.sample_rate)
         self.audio_size = 0
 
-    async def process_chunk(self, audio_bytes, websocket_manager, client_id):
-        """Process an audio chunk and return incremental transcription"""
-
-        self.audio_buffer.write(audio_bytes)
-        self.audio_size += len(audio_bytes)
-
-        print(f"Added {len(audio_bytes)} bytes to audio buffer for session {self.session_id}")
-
-
-        current_time = time.time()
-        time_since_last = current_time - self.last_transcription_time
-
-
-
-
-
-        should_transcribe = (
-            time_since_last > self.transcription_interval and
-            not self.pending_transcription and
-            self.audio_size > 10000
-        )
-
-        if should_transcribe:
-            self.pending_transcription = True
-            self.last_transcription_time = current_time
-
-            try:
-
-                future = self.executor.submit(self._transcribe_audio_buffer)
-                new_transcript = await asyncio.get_event_loop().run_in_executor(
-                    None, lambda: future.result()
-                )
-
-
-                if new_transcript and len(new_transcript) > 5:
-                    self.accumulated_text = new_transcript
-
-
-                    await websocket_manager.send_json(client_id, {
-                        "type": "transcription-update",
-                        "sessionId": self.session_id,
-                        "chunk": new_transcript,
-                        "fullTranscript": self.accumulated_text
-                    })
-
-            except Exception as e:
-                print(f"Error in transcription: {e}")
-                import traceback
-                traceback.print_exc()
-            finally:
-                self.pending_transcription = False
-
+        # Passes are triggered by utterance ends, silence is never sent to the model
+        self.vad = EnergyVAD(sample_rate=self.sample_rate)
+        self.utterances_transcribed = 0
+
+        # Ingest only enqueues; a per-session worker decodes and transcribes
+        self.chunk_queue = asyncio.Queue()
+        self.worker_task = None
+        self.pass_task = None
+        self.finalizing = False
+        self.websocket_manager = None
+        self.client_id = None
+
+    def add_chunk(self, sequence_number, websocket_manager, client_id):
+        """Queue a stored chunk for the background worker and return immediately"""
+        self.websocket_manager = websocket_manager
+        self.client_id = client_id
+        chunk = self.chunk_store.get(sequence_number)
+        self.audio_size += chunk.nbytes if chunk is not None else 0
+        self.chunk_queue.put_nowait(sequence_number)
+
+        # Once finalize() has stopped the worker it owns the decoder and drains the queue itself
+        if not self.finalizing and (self.worker_task is None or self.worker_task.done()):
+            self.worker_task = asyncio.create_task(self._run_worker())
 
         return {
             "new_text": "",
             "full_text": self.accumulated_text
         }
 
-    def _transcribe_audio_buffer(self):
-        """Transcribe the audio buffer - runs in a separate thread"""
+    def _decode_chunks(self, sequence_numbers):
+        chunks = [self.chunk_store.get(sequence) for sequence in sequence_numbers]
+        chunks = [chunk for chunk in chunks if chunk is not None]
+        # Every feed() returns only what it decoded since the previous call, so keep each part
+        parts = [self.decoder.feed(chunk) for chunk in chunks] if chunks else [self.decoder.read()]
+        parts = [part for part in parts if len(part)]
+        samples = np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+        return samples, sum(chunk.nbytes for chunk in chunks)
+
+    async def _run_worker(self):
+        """Decode queued chunks and schedule transcription passes off the ingest path"""
+        loop = asyncio.get_event_loop()
         try:
+            while True:
+                sequence_numbers = [await self.chunk_queue.get()]
+                while not self.chunk_queue.empty():
+                    sequence_numbers.append(self.chunk_queue.get_nowait())
+                stopping = STOP_WORKER in sequence_numbers
+                sequence_numbers = [sequence for sequence in sequence_numbers if sequence is not STOP_WORKER]
+
+                if sequence_numbers:
+                    samples, audio_bytes = await loop.run_in_executor(None, self._decode_chunks, sequence_numbers)
+                    self._append_pcm(samples)
+                    print(f"Decoded {audio_bytes} bytes ({len(samples)} samples) for session {self.session_id}")
+
+                if stopping:
+                    return
+
+                current_time = time.time()
+                time_since_last = current_time - self.last_transcription_time
+
+                if not self.pending_transcription:
+                    self._skip_silence()
+
+                window_start = int(self.committed_until * self.sample_rate)
+                window_seconds = (self.total_samples - window_start) / self.sample_rate
+                utterance_ended = self.vad.utterances_ended > self.utterances_transcribed
+                long_utterance = (
+                    self.vad.in_speech and
+                    (time_since_last > self.transcription_interval or window_seconds > self.max_window_seconds)
+                )
 
-            with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as temp_webm:
-                temp_webm_path = temp_webm.name
-
-                self.audio_buffer.seek(0)
-                temp_webm.write(self.audio_buffer.read())
-                self.audio_buffer.seek(0, 2)
-
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_wav:
-                temp_wav_path = temp_wav.name
-
-
-            ffmpeg_cmd = f'ffmpeg -y -i "{temp_webm_path}" -ar 16000 -ac 1 -acodec pcm_s16le "{temp_wav_path}"'
-            result = subprocess.run(ffmpeg_cmd, shell=True, capture_output=True, text=True)
-
-            if result.returncode != 0:
-                print(f"FFmpeg error: {result.stderr}")
-
-                self._cleanup_temp_files(temp_webm_path, temp_wav_path)
-                return ""
-
-
-            print(f"Transcribing temporary audio: {temp_wav_path}")
-            segments, info = self.model.transcribe(temp_wav_path, beam_size=5)
-
-            transcript = ""
-            segments_list = list(segments)
-
-            if segments_list:
-                print(f"Detected language '{info.language}' with probability {info.language_probability}")
-
-                for segment in segments_list:
-                    print(f"[{segment.start:.2f}s -> {segment.end:.2f}s] {segment.text}")
-                    transcript += segment.text + " "
-
-            result = transcript.strip()
-            print(f"Full transcript result: {result[:50]}...")
+                should_transcribe = (
+                    (utterance_ended or long_utterance) and
+                    not self.pending_transcription and
+                    self.vad.has_speech(window_start, self.total_samples)
+                )
 
+                if should_transcribe:
+                    self.pending_transcription = True
+                    self.last_transcription_time = current_time
+                    self.utterances_transcribed = self.vad.utterances_ended
+                    self.pass_task = asyncio.create_task(self._run_transcription_pass())
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Error in transcription worker for session {self.session_id}: {e}")
+            import traceback
+            traceback.print_exc()
 
-            self._cleanup_temp_files(temp_webm_path, temp_wav_path)
+    async def _run_transcription_pass(self):
+        try:
+            new_transcript = await self._transcribe_window()
+            self.vad.discard_before(int(self.committed_until * self.sample_rate))
 
-            return result
+            if new_transcript and len(new_transcript) > 5:
+                await self.send_update()
 
         except Exception as e:
             print(f"Error in transcription: {e}")
             import traceback
             traceback.print_exc()
-
+        finally:
+            self.pending_transcription = False
+
+    async def send_update(self):
+        """Send the transcript changes the client has not seen yet"""
+        if self.transcript.version <= self.sent_version:
+            return
+
+        if self.websocket_manager.supports(self.client_id, "transcript_deltas"):
+            message = {
+                "type": "transcription-update",
+                "sessionId": self.session_id,
+                **self.transcript.delta(self.sent_version)
+            }
+        else:
+            message = {
+                "type": "transcription-update",
+                "sessionId": self.session_id,
+                "chunk": self.accumulated_text,
+                "fullTranscript": self.accumulated_text
+            }
+        self.sent_version = self.transcript.version
+        await self.websocket_manager.send_json(self.client_id, message)
+
+    def acknowledge_version(self, version):
+        """Client confirmed it holds the transcript up to `version`"""
+        self.acked_version = max(self.acked_version, min(version, self.transcript.version))
+
+    def resume_from(self, version):
+        """Restart delta updates from the version a reconnecting client holds"""
+        if version is None:
+            version = self.acked_version
+        self.sent_version = max(0, min(version, self.transcript.version))
+        return self.transcript.delta(self.sent_version)
+
+    async def finalize(self):
+        """Decode what is left, transcribe only the uncommitted tail and return the stitched transcript"""
+        loop = asyncio.get_event_loop()
+        self.finalizing = True
+
+        # The worker drains the queue and finishes its in-flight decode before stopping;
+        # only it touches the decoder until then
+        if self.worker_task and not self.worker_task.done():
+            self.chunk_queue.put_nowait(STOP_WORKER)
+            await self.worker_task
+        remaining = []
+        while not self.chunk_queue.empty():
+            remaining.append(self.chunk_queue.get_nowait())
+        if remaining:
+            samples, _ = await loop.run_in_executor(None, self._decode_chunks, remaining)
+            self._append_pcm(samples)
+        self._append_pcm(await loop.run_in_executor(None, self.decoder.flush))
+
+        if self.pass_task and not self.pass_task.done():
             try:
-                self._cleanup_temp_files(temp_webm_path, temp_wav_path)
-            except:
+                await self.pass_task
+            except Exception:
                 pass
-            return ""
 
-    def _cleanup_temp_files(self, *file_paths):
-        """Clean up temporary files"""
-        for file_path in file_paths:
-            try:
-                if os.path.exists(file_path):
-                    os.unlink(file_path)
-            except Exception as e:
-                print(f"Error deleting file {file_path}: {e}")
+        tail_seconds = (self.total_samples / self.sample_rate) - self.committed_until
+        print(f"Finalizing session {self.session_id}: {len(self.committed_segments)} committed segments, {tail_seconds:.2f}s tail")
+        return await self._transcribe_window(final=True)
+
+    @property
+    def accumulated_text(self):
+        return self.transcript.text()
+
+    @property
+    def total_samples(self):
+        return self.pcm.total_samples
+
+    def _append_pcm(self, samples):
+        if len(samples) == 0:
+            return
+        self.vad.process(samples)
+        self.pcm.append(samples)
+
+    def _skip_silence(self):
+        """Advance the window start past trailing audio that holds no speech"""
+        if self.previous_hypothesis or self.vad.in_speech:
+            return
+        window_start = int(self.committed_until * self.sample_rate)
+        if self.vad.has_speech(window_start, self.total_samples):
+            return
+        silent_until = self.total_samples - self.vad.pad_samples
+        if silent_until > window_start:
+            self.committed_until = silent_until / self.sample_rate
+            self.vad.discard_before(silent_until)
+
+    def _speech_window(self, window, window_start_sample):
+        """Concatenate the speech regions of a window, with a map back to absolute time"""
+        window_end_sample = window_start_sample + len(window)
+        regions = self.vad.speech_regions(window_start_sample, window_end_sample)
+
+        pieces = []
+        parts = []
+        offset = 0
+        for region_start, region_end in regions:
+            parts.append(window[region_start - window_start_sample:region_end - window_start_sample])
+            pieces.append((offset / self.sample_rate, region_start / self.sample_rate))
+            offset += region_end - region_start
+
+        if not parts:
+            return np.zeros(0, dtype=np.float32), pieces
+        if len(parts) == 1:
+            return parts[0], pieces
+        return np.concatenate(parts), pieces
+
+    @staticmethod
+    def _to_absolute(t, pieces):
+        index = max(bisect.bisect_right([piece[0] for piece in pieces], t) - 1, 0)
+        piece_offset, piece_start = pieces[index]
+        return piece_start + (t - piece_offset)
+
+    async def _transcribe_window(self, final=False):
+        """Transcribe audio after committed_until and promote stable segments (all of them when final)"""
+        audio_end = self.total_samples / self.sample_rate
+
+        # A backlog longer than the model's window is worked through window by window, never skipped
+        while audio_end - self.committed_until > self.max_window_seconds:
+            await self._transcribe_span(self.committed_until + self.max_window_seconds, final, overflow=True)
+        await self._transcribe_span(audio_end, final)
+
+        result = self._publish()
+        print(f"Full transcript result: {result[:50]}...")
+        return result
+
+    async def _transcribe_span(self, window_end, final=False, overflow=False):
+        """Transcribe [committed_until, window_end) and advance the committed state.
+
+        An overflow span is followed by more audio: its segments are committed
+        except the last one, which may be cut at the boundary and is picked up
+        again by the next span.
+        """
+        window_start = self.committed_until
+        window_start_sample = int(window_start * self.sample_rate)
+        window = self.pcm.view(window_start_sample, int(window_end * self.sample_rate))
+        speech, pieces = self._speech_window(window, window_start_sample)
+        if len(speech) == 0:
+            if final or overflow:
+                self._force_commit(window_end)
+            return
+
+        print(f"Transcribing {len(speech) / self.sample_rate:.2f}s of speech in window [{window_start:.2f}s -> {window_end:.2f}s] for session {self.session_id}")
+        result = await self.scheduler.transcribe(
+            speech,
+            priority=PRIORITY_FINALIZE if final else PRIORITY_STREAMING,
+            client_id=self.client_id,
+            beam_size=5,
+            language=self.language,
+            initial_prompt=self._prompt_context(),
+            condition_on_previous_text=False,
+        )
+
+        hypothesis = []
+        for segment in result.segments:
+            text = segment.text.strip()
+            if not text:
+                continue
+            start = self._to_absolute(segment.start, pieces)
+            end = self._to_absolute(segment.end, pieces)
+            print(f"[{start:.2f}s -> {end:.2f}s] {text}")
+            hypothesis.append({
+                "start": start,
+                "end": end,
+                "text": text,
+            })
+
+        if hypothesis and self.language is None:
+            print(f"Detected language '{result.language}' with probability {result.language_probability}")
+            if result.language_probability >= self.language_lock_probability:
+                self.language = result.language
+
+        if overflow:
+            if len(hypothesis) > 1 and hypothesis[-2]["end"] > window_start:
+                self.committed_segments.extend(hypothesis[:-1])
+                self.committed_until = hypothesis[-2]["end"]
+            else:
+                self.committed_segments.extend(hypothesis)
+                self.committed_until = window_end
+            hypothesis = []
+        elif final:
+            self.committed_segments.extend(hypothesis)
+            self.committed_until = window_end
+            hypothesis = []
+        else:
+            hypothesis = self._promote_stable_segments(hypothesis, window_end)
+        self.previous_hypothesis = hypothesis
+
+    def _promote_stable_segments(self, hypothesis, audio_end):
+        """Commit the leading segments that match the previous pass; return the rest"""
+        promoted = 0
+        for segment in hypothesis:
+            if segment["end"] > audio_end - self.stability_margin:
+                break
+            if not any(self._same_segment(segment, previous) for previous in self.previous_hypothesis):
+                break
+            promoted += 1
+
+        for segment in hypothesis[:promoted]:
+            self.committed_segments.append(segment)
+            self.committed_until = segment["end"]
+
+        if promoted:
+            print(f"Committed {promoted} segments up to {self.committed_until:.2f}s for session {self.session_id}")
+
+        return hypothesis[promoted:]
+
+    def _force_commit(self, until):
+        """Commit tentative segments ending before `until` and advance the window start"""
+        remaining = []
+        for segment in self.previous_hypothesis:
+            if segment["end"] <= until:
+                self.committed_segments.append(segment)
+            else:
+                remaining.append(segment)
+        self.previous_hypothesis = remaining
+        self.committed_until = max(self.committed_until, until)
+
+    @staticmethod
+    def _same_segment(a, b, tolerance=0.5):
+        return (
+            a["text"].lower() == b["text"].lower() and
+            abs(a["start"] - b["start"]) <= tolerance
+        )
+
+    def _prompt_context(self):
+        if not self.committed_segments:
+            return None
+        context = " ".join(segment["text"] for segment in self.committed_segments[-10:])
+        return context[-self.prompt_chars:]
+
+    def _publish(self):
+        """Push the latest committed/tentative split into the transcript store"""
+        self.transcript.apply(self.committed_segments[self.published_committed:], self.previous_hypothesis)
+        self.published_committed = len(self.committed_segments)
+        return self.accumulated_text
+
+    def memory_usage(self):
+        """Bytes held by the decoded PCM window and the audio decoder"""
+        return {
+            "pcm_bytes": self.pcm.memory_bytes,
+            "decoder_bytes": self.decoder.memory_bytes,
+        }
 
     def cleanup(self):
         """Clean up resources"""
 
+        for task in (self.worker_task, self.pass_task):
+            if task and not task.done():
+                task.cancel()
+
         try:
-            self.audio_buffer.close()
-        except:
-            pass
-        self.executor.shutdown(wait=False)
+            self.decoder.close()
+        except Exception as e:
+            print(f"Error closing decoder for session {self.session_id}: {e}")
+        self.pcm.close()
 
 
 
 active_transcription_sessions = {}
+# Finalizations in flight, so a repeated end-session awaits the same result
+finalizing_sessions = {}
 
-def get_or_create_session(session_id):
-    """Get or create a transcription session"""
+def get_or_create_session(session_id, chunk_store, audio_format="webm"):
+    """Get or create a transcription session reading from the session's chunk store"""
     if session_id not in active_transcription_sessions:
-        active_transcription_sessions[session_id] = StreamingTranscriptionSession(session_id)
+        active_transcription_sessions[session_id] = StreamingTranscriptionSession(session_id, chunk_store, audio_format)
     return active_transcription_sessions[session_id]
 
-def end_session(session_id):
-    """End a transcription session and return the final transcript"""
-    print(f"Ending streaming transcription session: {session_id}")
-    print(f"Available sessions: {list(active_transcription_sessions.keys())}")
-
-    if session_id in active_transcription_sessions:
-        session = active_transcription_sessions[session_id]
-
-
-        transcription = session.accumulated_text
-
-
-        transcript_length = len(transcription) if transcription else 0
-        transcript_preview = transcription[:100] + "..." if transcript_length > 100 else transcription
-        print(f"Found transcription of length {transcript_length}")
-        print(f"Transcript preview: {transcript_preview}")
-
-        try:
-
-            session.cleanup()
-            del active_transcription_sessions[session_id]
-            print(f"Streaming transcription session {session_id} ended with {transcript_length} characters")
-        except Exception as e:
-            print(f"Error cleaning up session {session_id}: {e}")
-
+def get_session(session_id):
+    """Return the live streaming session, if any"""
+    return active_transcription_sessions.get(session_id)
+
+async def finalize_session(session_id):
+    """Finalize and end a streaming session; returns None when no streaming session exists"""
+    task = finalizing_sessions.get(session_id)
+    if task is None:
+        session = active_transcription_sessions.get(session_id)
+        if session is None:
+            print(f"Warning: No streaming transcription session found for {session_id}")
+            return None
+        task = asyncio.ensure_future(_finalize(session_id, session))
+        finalizing_sessions[session_id] = task
+        task.add_done_callback(lambda _: finalizing_sessions.pop(session_id, None))
+    # One caller giving up must not cancel the finalization the others are waiting on
+    return await asyncio.shield(task)
+
+async def _finalize(session_id, session):
+    try:
+        transcription = await session.finalize()
+        print(f"Streaming transcription session {session_id} finalized with {len(transcription)} characters")
         return transcription
-    else:
-
-        from app.services import main
-
-        try:
-            if hasattr(main, 'active_sessions') and session_id in main.active_sessions:
-
-                main_session = main.active_sessions[session_id]
-                if "transcript" in main_session and main_session["transcript"]:
-                    transcript = main_session["transcript"]
-                    print(f"Recovered transcript from main session: {len(transcript)} characters")
-                    return transcript
-        except Exception as recovery_error:
-            print(f"Failed to recover transcript from main session: {recovery_error}")
-
-        print(f"Warning: No streaming transcription session found for {session_id}")
-        return ""
\ No newline at end of file
+    finally:
+        discard_session(session_id)
+
+def discard_session(session_id):
+    """Stop a streaming session and release its PCM buffer and decoder; True if one existed"""
+    session = active_transcription_sessions.pop(session_id, None)
+    if session is None:
+        return False
+    session.cleanup()
+    return True
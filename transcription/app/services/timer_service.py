@@ -0,0 +1,101 @@
+"""
+Process-wide timer service.
+
+One heap of deadlines drives every periodic job on the event loop:
+connection inactivity checks, app-level pings and processing heartbeats.
+Each tick only pops the timers that are due, so the cost scales with the
+number of expiring timers rather than the number of connections.
+
+A timer is identified by a key; scheduling the same key again replaces it.
+Callbacks (plain or async) return the delay in seconds until they should
+run again, or None to stop.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+import traceback
+
+
+class TimerService:
+    """Keyed one-shot/recurring timers on a single min-heap"""
+
+    def __init__(self):
+        self._heap = []
+        self._timers = {}
+        self._firing = {}
+        self._sequence = itertools.count()
+        self._tasks = set()
+        self._wakeup = None
+        self._runner = None
+
+    def start(self):
+        if self._runner is None or self._runner.done():
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.get_event_loop().create_task(self._run())
+
+    def schedule(self, key, delay, callback):
+        """Run `callback` after `delay` seconds, replacing any timer with the same key"""
+        self._firing.pop(key, None)
+        entry = (time.monotonic() + max(delay, 0), next(self._sequence), key, callback)
+        self._timers[key] = entry
+        heapq.heappush(self._heap, entry)
+        self.start()
+        if self._heap[0] is entry:
+            self._wakeup.set()
+
+    def cancel(self, key):
+        firing = self._firing.pop(key, None) is not None
+        cancelled = self._timers.pop(key, None) is not None
+        # Cancelled entries stay in the heap until popped; rebuild if they pile up
+        if len(self._heap) > 2 * len(self._timers) + 64:
+            self._heap = list(self._timers.values())
+            heapq.heapify(self._heap)
+        return cancelled or firing
+
+    def __contains__(self, key):
+        return key in self._timers or key in self._firing
+
+    def __len__(self):
+        return len(self._timers)
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                key = entry[2]
+                if self._timers.get(key) is not entry:
+                    continue
+                del self._timers[key]
+                self._firing[key] = entry
+                task = asyncio.create_task(self._fire(entry))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, entry):
+        _, _, key, callback = entry
+        next_delay = None
+        try:
+            next_delay = callback()
+            if asyncio.iscoroutine(next_delay):
+                next_delay = await next_delay
+        except Exception as e:
+            print(f"Error in timer {key}: {e}")
+            traceback.print_exc()
+
+        # Only re-arm if nobody cancelled or replaced the timer while it ran
+        if self._firing.get(key) is entry:
+            del self._firing[key]
+            if next_delay is not None:
+                self.schedule(key, next_delay, callback)
+
+
+timer_service = TimerService()
@@ -0,0 +1,111 @@
+"""
+Segment-level transcript of a streaming session.
+
+Segments are addressed by position: committed (stable) segments never
+change, so only the unstable tail is ever revised. Every change bumps a
+monotonically increasing version, which lets clients receive just the
+segments added or revised since the version they last acknowledged.
+"""
+from collections import deque
+
+
+def _content(segment):
+    return (segment["start"], segment["end"], segment["text"], segment["stable"])
+
+
+class TranscriptStore:
+    """Versioned list of transcript segments with delta extraction"""
+
+    def __init__(self, change_log_size=256):
+        self.segments = []
+        self.stable_count = 0
+        self.version = 0
+        # Texts of the stable segments, joined only when the transcript is read
+        self._committed_texts = []
+        self._text_cache = (0, "")
+        # (version, first segment index touched by that version)
+        self._changes = deque(maxlen=change_log_size)
+
+    def apply(self, committed, tentative):
+        """Append newly committed segments and replace the unstable tail"""
+        first_changed = self.stable_count
+        new_segments = [
+            {"start": segment["start"], "end": segment["end"], "text": segment["text"], "stable": True}
+            for segment in committed
+        ] + [
+            {"start": segment["start"], "end": segment["end"], "text": segment["text"], "stable": False}
+            for segment in tentative
+        ]
+
+        old_tail = self.segments[first_changed:]
+        if [_content(segment) for segment in new_segments] == [_content(segment) for segment in old_tail]:
+            return False
+
+        # Skip the leading part of the tail that did not change
+        while new_segments and old_tail and _content(new_segments[0]) == _content(old_tail[0]):
+            new_segments.pop(0)
+            old_tail.pop(0)
+            first_changed += 1
+
+        self.version += 1
+        del self.segments[first_changed:]
+        for segment in new_segments:
+            segment["id"] = len(self.segments)
+            segment["version"] = self.version
+            self.segments.append(segment)
+
+        self._committed_texts.extend(segment["text"] for segment in committed)
+        self.stable_count += len(committed)
+        self._changes.append((self.version, first_changed))
+        return True
+
+    def changes_since(self, version):
+        """Segments added or revised after `version` (all segments if it is too old)"""
+        if version >= self.version:
+            return []
+        if not self._changes or version < self._changes[0][0] - 1:
+            first = 0
+        else:
+            first = min(index for change_version, index in self._changes if change_version > version)
+        return self.segments[first:]
+
+    def delta(self, version):
+        """Protocol payload describing the transcript changes after `version`"""
+        return {
+            "baseVersion": version,
+            "version": self.version,
+            "segmentCount": len(self.segments),
+            "segments": [
+                {key: segment[key] for key in ("id", "start", "end", "text", "stable")}
+                for segment in self.changes_since(version)
+            ],
+        }
+
+    def text(self):
+        """Full transcript; joined at most once per version"""
+        version, text = self._text_cache
+        if version != self.version:
+            tail = [segment["text"] for segment in self.segments[self.stable_count:]]
+            text = " ".join(self._committed_texts + tail)
+            self._text_cache = (self.version, text)
+        return text
+
+    def committed_text(self):
+        return " ".join(self._committed_texts)
+
+
+def merge_deltas(older, newer):
+    """Combine two consecutive transcription-update deltas into one.
+
+    Falls back to `newer` when they do not chain (legacy full-transcript
+    updates, or a resume that restarted from an earlier version).
+    """
+    if "segments" not in older or "segments" not in newer or newer.get("baseVersion") != older.get("version"):
+        return newer
+    segments = {segment["id"]: segment for segment in older["segments"]}
+    segments.update((segment["id"], segment) for segment in newer["segments"])
+    return {
+        **newer,
+        "baseVersion": older["baseVersion"],
+        "segments": [segments[index] for index in sorted(segments) if index < newer["segmentCount"]],
+    }
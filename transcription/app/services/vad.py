@@ -0,0 +1,107 @@
+"""
+Energy-based voice activity detection on the decoded PCM stream.
+"""
+import numpy as np
+
+
+class EnergyVAD:
+    """Streaming frame-energy VAD with an adaptive noise floor"""
+
+    def __init__(self, sample_rate=16000, frame_ms=30, threshold_db=9.0, min_energy_db=-50.0,
+                 min_speech_ms=120, min_silence_ms=500, pad_ms=200):
+        self.sample_rate = sample_rate
+        self.frame_size = int(sample_rate * frame_ms / 1000)
+        self.threshold_db = threshold_db
+        self.min_energy_db = min_energy_db
+        self.min_speech_frames = max(1, int(min_speech_ms / frame_ms))
+        self.min_silence_frames = max(1, int(min_silence_ms / frame_ms))
+        self.pad_samples = int(sample_rate * pad_ms / 1000)
+
+        # Start from a quiet floor: seeding from the first frame would turn a
+        # session that opens mid-utterance into permanent "silence"
+        self.noise_db = min_energy_db
+        self.processed_samples = 0
+        self._remainder = np.zeros(0, dtype=np.float32)
+
+        self.in_speech = False
+        self._speech_run = 0
+        self._silence_run = 0
+        self._candidate_start = 0
+        self._current_start = None
+
+        self.regions = []
+        self.utterances_ended = 0
+
+    def process(self, samples):
+        """Consume new samples and update speech regions"""
+        if len(samples) == 0:
+            return
+        if len(self._remainder):
+            samples = np.concatenate((self._remainder, samples))
+
+        n_frames = len(samples) // self.frame_size
+        usable = n_frames * self.frame_size
+        self._remainder = samples[usable:]
+        if n_frames == 0:
+            return
+
+        frames = samples[:usable].reshape(n_frames, self.frame_size)
+        energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+
+        for db in energy_db:
+            self._process_frame(float(db))
+            self.processed_samples += self.frame_size
+
+    def _process_frame(self, db):
+        is_speech = db > self.min_energy_db and db > self.noise_db + self.threshold_db
+
+        if is_speech:
+            self._silence_run = 0
+            if self._speech_run == 0:
+                self._candidate_start = self.processed_samples
+            self._speech_run += 1
+            if not self.in_speech and self._speech_run >= self.min_speech_frames:
+                self.in_speech = True
+                self._current_start = self._candidate_start
+        else:
+            self._speech_run = 0
+            # Track the floor quickly downwards and slowly upwards
+            if db < self.noise_db:
+                self.noise_db = db
+            else:
+                self.noise_db = 0.995 * self.noise_db + 0.005 * db
+
+            if self.in_speech:
+                self._silence_run += 1
+                if self._silence_run >= self.min_silence_frames:
+                    end = self.processed_samples - (self._silence_run - 1) * self.frame_size
+                    self.regions.append((self._current_start, end))
+                    self.in_speech = False
+                    self._current_start = None
+                    self._silence_run = 0
+                    self.utterances_ended += 1
+
+    def speech_regions(self, start_sample, end_sample):
+        """Padded speech regions clipped to [start_sample, end_sample)"""
+        regions = list(self.regions)
+        if self.in_speech:
+            regions.append((self._current_start, end_sample))
+
+        result = []
+        for region_start, region_end in regions:
+            region_start = max(region_start - self.pad_samples, start_sample)
+            region_end = min(region_end + self.pad_samples, end_sample)
+            if region_end <= region_start:
+                continue
+            if result and region_start <= result[-1][1]:
+                result[-1] = (result[-1][0], max(result[-1][1], region_end))
+            else:
+                result.append((region_start, region_end))
+        return result
+
+    def has_speech(self, start_sample, end_sample):
+        return bool(self.speech_regions(start_sample, end_sample))
+
+    def discard_before(self, sample):
+        """Forget closed regions that end before `sample`"""
+        self.regions = [region for region in self.regions if region[1] + self.pad_samples > sample]
@@ -0,0 +1,91 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("unsloth")
+
+from app.services.note_engine import NoteEngine
+
+
+VOCAB_SIZE = 32
+EOS_TOKEN_ID = 0
+
+
+class CountingTokenizer:
+    """Prompts are space-separated token ids; decoding joins them back"""
+
+    eos_token_id = EOS_TOKEN_ID
+
+    def apply_chat_template(self, messages, tokenize=True, add_generation_prompt=True, return_tensors="pt"):
+        return torch.tensor([[int(token) for token in messages[-1]["content"].split()]])
+
+    def decode(self, tokens, skip_special_tokens=True):
+        return " ".join(str(token) for token in tokens)
+
+
+class PagedAttention(torch.nn.Module):
+    """Mimics Unsloth's decode path: a KV copy sized for the first batch it sees, reused until deleted"""
+
+    def forward(self, keys, past_keys):
+        if not hasattr(self, "paged_attention"):
+            self.paged_attention = past_keys.clone()
+        elif not torch.equal(self.paged_attention, past_keys):
+            raise RuntimeError("stale paged KV cache")
+        self.paged_attention = torch.cat([self.paged_attention, keys], dim=2)
+        return self.paged_attention
+
+
+class CountingModel(torch.nn.Module):
+    """Predicts the next token id as the current one plus one, wrapping to EOS"""
+
+    generation_config = None
+
+    def __init__(self):
+        super().__init__()
+        self.layer = PagedAttention()
+        self.prefill_logits = []
+
+    @property
+    def device(self):
+        return torch.device("cpu")
+
+    def forward(self, input_ids, attention_mask, position_ids=None, past_key_values=None,
+                use_cache=True, num_logits_to_keep=0):
+        keys = input_ids.float()[:, None, :, None]
+        if past_key_values is None:
+            cache = keys
+        else:
+            if hasattr(past_key_values, "to_legacy_cache"):
+                past_key_values = past_key_values.to_legacy_cache()
+            cache = self.layer(keys, past_key_values[0][0])
+
+        next_ids = (input_ids + 1) % VOCAB_SIZE
+        if num_logits_to_keep:
+            next_ids = next_ids[:, -num_logits_to_keep:]
+        if past_key_values is None:
+            self.prefill_logits.append(next_ids.shape[1])
+        logits = torch.nn.functional.one_hot(next_ids, VOCAB_SIZE).float()
+        return SimpleNamespace(logits=logits, past_key_values=((cache, cache),))
+
+
+class StaticManager:
+    def __init__(self, model, tokenizer):
+        self.model, self.tokenizer = model, tokenizer
+
+    @contextmanager
+    def acquire(self):
+        yield self.model, self.tokenizer
+
+
+def test_concurrent_requests_stopping_at_different_lengths():
+    model = CountingModel()
+    engine = NoteEngine(manager=StaticManager(model, CountingTokenizer()), max_batch_size=4)
+
+    short = engine.submit([{"role": "user", "content": "27 28"}])
+    long = engine.submit([{"role": "user", "content": "19 20"}])
+
+    assert short.result(timeout=10) == "29 30 31"
+    assert long.result(timeout=10) == " ".join(str(token) for token in range(21, 32))
+    assert model.prefill_logits == [1, 1]
@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("faster_whisper")
+pytest.importorskip("unsloth")
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+def test_send_queue_metrics_for_connected_client():
+    client = TestClient(app)
+    with client.websocket_connect("/ws?client_id=send-queue-test"):
+        response = client.get("/api/connections/send-queues")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["connections"] >= 1
+    metrics = body["clients"]["send-queue-test"]
+    assert set(metrics["depthByPriority"]) == {"control", "update", "heartbeat"}
+    assert metrics["underPressure"] is False